@@ -16,3 +16,13 @@ command_conf_file = (
     else None
 )
 command_conf = config.CommandsConfig(command_conf_file)
+rename_journal_file = (
+    os.path.join(config_folder_path, "rename.journal")
+    if config_folder_path
+    else None
+)
+rename_history_file = (
+    os.path.join(config_folder_path, "rename_history.json")
+    if config_folder_path
+    else None
+)
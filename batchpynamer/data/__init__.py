@@ -24,6 +24,7 @@ ALL_RENAME_FIELDS = {
     "replace_replace_this": "",
     "replace_replace_with": "",
     "replace_match_case": False,
+    "replace_table_file": "",
     "case_case_want": (
         "Same",
         "Upper Case",
@@ -0,0 +1,234 @@
+import collections
+import os
+import threading
+
+
+class FileCache:
+    """
+    Objects loaded from files, reused while the file doesn't change.
+
+    Each object is saved with the signature of its file when it was loaded
+    (modification time and size), and it's only loaded again when the
+    signature of the file changes. Only the max_size most recently used
+    objects are kept.
+
+    load is called as load(path, *args) with the same args given to get,
+    and the args are part of the key (the same file can be loaded in
+    different ways).
+
+    With max_bytes and size_get (returns the approximate size in bytes of
+    an object) the least recently used objects are also evicted to keep
+    their total size under max_bytes.
+
+    Thread safe, the files are loaded outside the lock so they can be
+    loaded at the same time.
+    """
+
+    def __init__(self, load, max_size, max_bytes=None, size_get=None):
+        self.load = load
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.size_get = size_get
+        # Total size of the cached objects, when measured
+        self.num_bytes = 0
+        # {(path, *args): (signature, object, size)}, least recently used
+        # first
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, *args):
+        """
+        Returns the object for the file, loading it when it isn't cached or
+        the file changed since.
+
+        Raises FileNotFoundError when the path doesn't exist.
+        """
+        signature = file_signature_get(path)
+        key = (path, *args)
+
+        with self._lock:
+            try:
+                cached_signature, obj, _ = self._cache[key]
+            except KeyError:
+                pass
+            else:
+                if cached_signature == signature:
+                    self._cache.move_to_end(key)
+                    return obj
+
+        obj = self.load(path, *args)
+        size = 0 if self.size_get is None else self.size_get(obj)
+
+        with self._lock:
+            self._pop(key)
+            self._cache[key] = (signature, obj, size)
+            self.num_bytes += size
+            # Evict the least recently used objects, always keeping the
+            # last
+            while len(self._cache) > 1 and (
+                len(self._cache) > self.max_size
+                or (
+                    self.max_bytes is not None
+                    and self.num_bytes > self.max_bytes
+                )
+            ):
+                _, (_, _, evicted_size) = self._cache.popitem(last=False)
+                self.num_bytes -= evicted_size
+
+        return obj
+
+    def invalidate(self, path, *args):
+        """
+        Forgets the cached object of the file, to use after changing it
+        (the signature might not change when it's written fast enough)
+        """
+        with self._lock:
+            self._pop((path, *args))
+
+    def _pop(self, key):
+        """Removes the key from the cache, if it's there"""
+        try:
+            _, _, size = self._cache.pop(key)
+        except KeyError:
+            return
+        self.num_bytes -= size
+
+    def clear(self):
+        """Forgets every cached object"""
+        with self._lock:
+            self._cache.clear()
+            self.num_bytes = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def file_signature_get(path):
+    """
+    Returns the modification time and size of the file, which change
+    whenever the file does.
+
+    Raises FileNotFoundError when the path doesn't exist.
+    """
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class FrozenKey:
+    """
+    Hashable values that compute their hash only once, for the parts of
+    a key that are the same in many lookups
+    """
+
+    __slots__ = ("values", "_hash")
+
+    def __init__(self, values):
+        self.values = values
+        self._hash = hash(values)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self is other or (
+            isinstance(other, FrozenKey) and self.values == other.values
+        )
+
+
+class MemoCache:
+    """
+    Results kept by the key of what they depend on, so they are only
+    computed once.
+
+    The results are grouped by the part of their key shared by many of
+    them (like the fields they were computed with), and looked up with
+    the group and the rest of the key. Only the most recently used groups
+    are kept, up to max_size results in total (the group in use is kept
+    whole).
+
+    Counts the hits (results reused) and misses (results computed), to
+    tune the size.
+    """
+
+    # Returned by lookup when the key isn't cached
+    MISSING = object()
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # {group: {key: result}}, least recently used group first
+        self._groups = collections.OrderedDict()
+        # Number of results of all the groups
+        self._size = 0
+
+    def get(self, group, key, compute):
+        """
+        Returns the result for the key, calling compute() to get it when
+        it isn't cached
+        """
+        result = self.lookup(group, key, self.MISSING)
+        if result is self.MISSING:
+            result = compute()
+            self.put(group, key, result)
+
+        return result
+
+    def lookup(self, group, key, default=None):
+        """Returns the result for the key, or default when it isn't cached"""
+        try:
+            result = self._groups[group][key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._groups.move_to_end(group)
+        return result
+
+    def lookup_many(self, group, keys):
+        """
+        Returns the list of results for all the keys, or None when any of
+        them isn't cached
+        """
+        try:
+            results = self._groups[group]
+            results = [results[key] for key in keys]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.hits += len(results)
+        self._groups.move_to_end(group)
+        return results
+
+    def put(self, group, key, result):
+        """Remembers the result for the key"""
+        self.put_many(group, (key,), (result,))
+
+    def put_many(self, group, keys, results):
+        """Remembers the results for all the keys"""
+        try:
+            group_results = self._groups[group]
+        except KeyError:
+            group_results = self._groups[group] = {}
+        self._groups.move_to_end(group)
+
+        self._size -= len(group_results)
+        group_results.update(zip(keys, results))
+        self._size += len(group_results)
+
+        # Evict the least recently used groups
+        while self._size > self.max_size and len(self._groups) > 1:
+            _, evicted = self._groups.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self):
+        """Forgets every result and resets the counters"""
+        self._groups.clear()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,284 @@
+import collections
+import logging
+import os
+import sys
+
+# Kinds of rename conflicts
+CONFLICT_DUPLICATE = "Same new name as another item"
+CONFLICT_EXISTING = "New name already exists"
+CONFLICT_CASE = "New name only differs in case from another item"
+
+# Platforms whose file systems usually don't tell names apart by case,
+# for the folders that can't be probed
+CASE_INSENSITIVE_PLATFORMS = ("win32", "cygwin", "darwin")
+
+# Formats of the suffix added to the new names that collide, with the
+# name without extension, the counter and the extension
+COLLISION_SUFFIX_FORMATS = ("{name} ({n}){ext}", "{name}_{n:03}{ext}")
+
+# A rename that can't be done: the item, its new path, the kind of
+# conflict and the path it conflicts with
+RenameConflict = collections.namedtuple(
+    "RenameConflict", ("old_path", "new_path", "kind", "other_path")
+)
+
+
+class DirListing:
+    """
+    The names inside a folder, indexed by name and by casefolded name.
+    Listing the folder is done once per folder, and whether the folder
+    tells names apart by case is only probed when it's needed
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            names = []
+
+        self.names = set(names)
+        # {casefolded name: [names]}
+        self.folded_names = collections.defaultdict(list)
+        for name in names:
+            self.folded_names[name.casefold()].append(name)
+
+        self._case_insensitive = None
+
+    @property
+    def case_insensitive(self):
+        """
+        Whether names that only differ in case are the same item in the
+        folder. Probed once, with a single stat
+        """
+        if self._case_insensitive is None:
+            self._case_insensitive = _case_insensitive_probe(
+                self.directory, self.names
+            )
+        return self._case_insensitive
+
+
+def _case_insensitive_probe(directory, names):
+    """
+    Checks if the file system of a folder is case insensitive: looks up
+    one of its names with the case swapped, or the folder itself when it
+    has no names with case. Uses the platform default when the folder
+    doesn't exist
+    """
+    for name in names:
+        swapped_name = name.swapcase()
+        if swapped_name != name and swapped_name not in names:
+            return os.path.lexists(os.path.join(directory, swapped_name))
+
+    parent, dir_name = os.path.split(os.path.normpath(directory))
+    swapped_name = dir_name.swapcase()
+    if swapped_name != dir_name:
+        try:
+            return os.path.samefile(
+                directory, os.path.join(parent, swapped_name)
+            )
+        except OSError:
+            pass
+
+    return sys.platform.startswith(CASE_INSENSITIVE_PLATFORMS)
+
+
+def rename_conflicts_get(renames, dir_listings=None):
+    """
+    Checks all the renames at once before doing any of them. renames is
+    a list of (old_path, new_path) pairs, the pairs where both are the
+    same are skipped.
+
+    Returns a list of RenameConflict, with every item that:
+        - Has the same new path as another item (both items are listed)
+        - Has a new path that already exists and isn't an item being
+        renamed itself
+        - Has a new path that only differs in case from the new path of
+        another item or an existing path that isn't being renamed, only
+        in folders that are case insensitive (it would be the same file)
+
+    dir_listings is a {folder: DirListing} dict, to reuse the listings
+    between checks. Each folder is only listed once, so it takes a single
+    pass over the renames.
+    """
+    if dir_listings is None:
+        dir_listings = {}
+
+    renames = [(old, new) for old, new in renames if old != new]
+    new_paths = dict(renames)
+    # Paths that are being renamed, and so will be free
+    sources = {old for old, new in renames}
+
+    # {new path: old path} and {(folder, casefolded new name): old path}
+    # of the first item with each new path
+    targets = {}
+    folded_targets = {}
+    # {old path: RenameConflict}, one per item
+    conflicts = {}
+
+    def _conflict_add(old_path, new_path, kind, other_path):
+        if old_path not in conflicts:
+            conflicts[old_path] = RenameConflict(
+                old_path, new_path, kind, other_path
+            )
+
+    for old_path, new_path in renames:
+        directory, new_name = os.path.split(new_path)
+
+        # Duplicated new paths
+        other_path = targets.setdefault(new_path, old_path)
+        if other_path != old_path:
+            _conflict_add(old_path, new_path, CONFLICT_DUPLICATE, other_path)
+            _conflict_add(other_path, new_path, CONFLICT_DUPLICATE, old_path)
+            continue
+
+        try:
+            dir_listing = dir_listings[directory]
+        except KeyError:
+            dir_listing = dir_listings[directory] = DirListing(directory)
+
+        folded_name = new_name.casefold()
+        other_path = folded_targets.setdefault(
+            (directory, folded_name), old_path
+        )
+
+        # Existing paths
+        if new_name in dir_listing.names:
+            if new_path not in sources:
+                _conflict_add(old_path, new_path, CONFLICT_EXISTING, new_path)
+            continue
+
+        # The rest only clash in case insensitive folders. The folder is
+        # only probed when a name has the same casefolded name as another
+        existing_names = dir_listing.folded_names.get(folded_name, ())
+        if (
+            other_path == old_path and not existing_names
+        ) or not dir_listing.case_insensitive:
+            continue
+
+        # New paths only differing in case
+        if other_path != old_path:
+            _conflict_add(old_path, new_path, CONFLICT_CASE, other_path)
+            _conflict_add(
+                other_path, new_paths[other_path], CONFLICT_CASE, old_path
+            )
+            continue
+
+        # Existing paths only differing in case
+        for existing_name in existing_names:
+            existing_path = os.path.join(directory, existing_name)
+            # Only changing the case of its own name is fine
+            if existing_path != old_path and existing_path not in sources:
+                _conflict_add(old_path, new_path, CONFLICT_CASE, existing_path)
+                break
+
+    if conflicts:
+        logging.debug(f"Found {len(conflicts)} rename conflicts")
+
+    return list(conflicts.values())
+
+
+def rename_collisions_resolve(
+    renames, suffix_format=COLLISION_SUFFIX_FORMATS[0], dir_listings=None
+):
+    """
+    Makes every new path unique by adding a counter suffix (following
+    suffix_format, like "name (2).ext") to the new names that are already
+    taken: by an existing item that isn't being renamed or by a previous
+    rename of the list. Names that only differ in case count as the same
+    in case insensitive folders.
+
+    renames is a list of (old_path, new_path), the order decides which
+    item keeps the name. Returns the list with the new paths resolved.
+
+    Each folder is listed only once (dir_listings is a {folder:
+    DirListing} dict, to reuse the listings), and the taken names are
+    kept in a set per folder, with the last counter used for each name,
+    so resolving many collisions doesn't check the same names again.
+    """
+    if dir_listings is None:
+        dir_listings = {}
+
+    # Paths that are being renamed, and so will be free
+    sources = {old for old, new in renames if old != new}
+    # {folder: (set of names taken, function giving the name to compare)},
+    # the names are casefolded in case insensitive folders
+    taken = {}
+    # {(folder, compared new name): last counter used}
+    counters = {}
+
+    def _taken_get(directory):
+        try:
+            return taken[directory]
+        except KeyError:
+            pass
+
+        try:
+            dir_listing = dir_listings[directory]
+        except KeyError:
+            dir_listing = dir_listings[directory] = DirListing(directory)
+
+        if dir_listing.case_insensitive:
+            name_key = str.casefold
+            dir_taken = {
+                folded_name
+                for folded_name, names in dir_listing.folded_names.items()
+                if any(
+                    os.path.join(directory, name) not in sources
+                    for name in names
+                )
+            }
+        else:
+            name_key = str
+            dir_taken = {
+                name
+                for name in dir_listing.names
+                if os.path.join(directory, name) not in sources
+            }
+
+        taken[directory] = (dir_taken, name_key)
+        return taken[directory]
+
+    resolved = []
+    num_resolved = 0
+    for old_path, new_path in renames:
+        # Items keeping their name are already counted in their folder
+        if old_path == new_path:
+            resolved.append((old_path, new_path))
+            continue
+
+        directory, new_name = os.path.split(new_path)
+        dir_taken, name_key = _taken_get(directory)
+        key_name = name_key(new_name)
+
+        if key_name in dir_taken:
+            name, ext = os.path.splitext(new_name)
+            n = counters.get((directory, key_name), 1)
+            while True:
+                n += 1
+                new_name = suffix_format.format(name=name, n=n, ext=ext)
+                if name_key(new_name) not in dir_taken:
+                    break
+            counters[(directory, key_name)] = n
+            new_path = os.path.join(directory, new_name)
+            num_resolved += 1
+
+        dir_taken.add(name_key(new_name))
+        resolved.append((old_path, new_path))
+
+    if num_resolved:
+        logging.debug(f"Resolved {num_resolved} name collisions")
+
+    return resolved
+
+
+def collision_name_get(new_name, new_path):
+    """
+    Returns the new name with the name of the resolved new path, keeping
+    the folders of the new name (when renaming into folders)
+    """
+    new_path_name = os.path.basename(new_path)
+    if os.path.basename(new_name) == new_path_name:
+        return new_name
+
+    return os.path.join(os.path.dirname(new_name), new_path_name)
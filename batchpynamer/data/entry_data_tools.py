@@ -0,0 +1,64 @@
+import collections
+import os
+import stat
+
+# What's known of an item of the file view: if it's a file or a folder
+# (following symlinks, like os.path.isfile), its size in bytes, its
+# modification time and its inode. size and mtime are None when the item
+# couldn't be stat'd (like broken symlinks)
+EntryInfo = collections.namedtuple(
+    "EntryInfo", ("is_file", "is_dir", "size", "mtime", "inode")
+)
+
+
+def entry_info_get(entry):
+    """
+    Returns the EntryInfo of an os.DirEntry.
+
+    The type and inode come from the folder scan, so only getting the size
+    and modification time needs a stat call, and that's done only once,
+    when the folder is scanned
+    """
+    try:
+        entry_stat = entry.stat()
+    except OSError:
+        size = mtime = None
+    else:
+        size = entry_stat.st_size
+        mtime = entry_stat.st_mtime
+
+    return EntryInfo(
+        is_file=entry.is_file(),
+        is_dir=entry.is_dir(),
+        size=size,
+        mtime=mtime,
+        inode=entry.inode(),
+    )
+
+
+def path_info_get(path, entries_info=None):
+    """
+    Returns the EntryInfo of a path, from the entries_info mapping
+    ({path: EntryInfo}) when the path is in it. Otherwise it stats the
+    path
+    """
+    if entries_info is not None:
+        try:
+            return entries_info[path]
+        except KeyError:
+            pass
+
+    try:
+        path_stat = os.stat(path)
+    except (OSError, ValueError):
+        return EntryInfo(
+            is_file=False, is_dir=False, size=None, mtime=None, inode=None
+        )
+
+    return EntryInfo(
+        is_file=stat.S_ISREG(path_stat.st_mode),
+        is_dir=stat.S_ISDIR(path_stat.st_mode),
+        size=path_stat.st_size,
+        mtime=path_stat.st_mtime,
+        inode=path_stat.st_ino,
+    )
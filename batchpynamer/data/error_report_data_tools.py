@@ -0,0 +1,68 @@
+import collections
+import csv
+import logging
+
+# A rename that failed: the item, its new path, the errno of the error
+# (None when it didn't come from the system), the kind of error and the
+# full error message
+RenameError = collections.namedtuple(
+    "RenameError", ("old_path", "new_path", "errno", "reason", "msg")
+)
+
+
+class RenameErrorReport:
+    """
+    All the errors of a rename batch together, counted by reason.
+
+    It's built from the results once the batch is over, so collecting the
+    errors doesn't slow down the renames.
+    """
+
+    # Columns of the exported report
+    columns = ("Path", "Target", "Errno", "Reason")
+
+    def __init__(self, results):
+        # The results are None for the renames done
+        self.errors = [result for result in results if result is not None]
+        self.counts = collections.Counter(
+            error.reason for error in self.errors
+        )
+
+    def __len__(self):
+        return len(self.errors)
+
+    def rows_get(self):
+        """Returns the errors as rows of (path, target, errno, reason)"""
+        return [
+            (
+                error.old_path,
+                error.new_path,
+                "" if error.errno is None else error.errno,
+                error.reason,
+            )
+            for error in self.errors
+        ]
+
+    def summary_get(self):
+        """Returns the number of errors by reason, most common first"""
+        return "\n".join(
+            f"{reason}: {count}" for reason, count in self.counts.most_common()
+        )
+
+    def export(self, path):
+        """
+        Writes the report to a tab separated values file. Returns None when
+        successful, otherwise an error message
+        """
+        try:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f, delimiter="\t")
+                writer.writerow(self.columns)
+                writer.writerows(self.rows_get())
+        except OSError as error:
+            error_msg = f"Couldn't export the error report: {error}"
+            logging.error(error_msg)
+            return error_msg
+
+        logging.info(f'Exported error report to "{path}"')
+        return None
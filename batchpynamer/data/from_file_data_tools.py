@@ -0,0 +1,77 @@
+import logging
+import mmap
+import os
+from array import array
+
+from batchpynamer.data.cache_data_tools import FileCache
+
+# Number of name list files kept open and indexed at the same time
+FROM_FILE_CACHE_SIZE = 4
+
+
+class FromFileLines:
+    """
+    The lines of a name list file, read on demand.
+
+    The file is memory mapped and the offset where each line starts is
+    indexed once when loading, so getting lines[idx] is just slicing the
+    map and decoding that one line. The lines are never all held as python
+    strings at the same time, so it works for lists as big as the file
+    system allows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        # Offset where each line starts, plus the end of the last line
+        self._offsets = array("Q")
+
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # Empty files can't be memory mapped (and have no lines anyway)
+            if size:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map is not None:
+            self._index_lines(size)
+
+        logging.debug(f'Indexed {len(self)} lines from "{path}"')
+
+    def _index_lines(self, size):
+        """Saves the offset where each line starts"""
+        start = 0
+        while start < size:
+            self._offsets.append(start)
+            end = self._map.find(b"\n", start)
+            # The last line doesn't need to end with a newline
+            if end == -1:
+                break
+            start = end + 1
+
+        self._offsets.append(size)
+
+    def __len__(self):
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, idx):
+        """Returns the line (without the newline chars) at idx"""
+        if not 0 <= idx < len(self):
+            raise IndexError("name list index out of range")
+
+        line = self._map[self._offsets[idx] : self._offsets[idx + 1]]
+        return line.decode(errors="replace").rstrip("\r\n")
+
+
+# Loaded name lists, reused while the file doesn't change
+_from_file_lines_cache = FileCache(FromFileLines, FROM_FILE_CACHE_SIZE)
+
+
+def from_file_lines_get(path):
+    """
+    Returns the FromFileLines for the path, reusing the already loaded one
+    while the file hasn't changed (same modification time and size).
+
+    Raises FileNotFoundError when the path doesn't exist and
+    IsADirectoryError when it's a directory.
+    """
+    return _from_file_lines_cache.get(path)
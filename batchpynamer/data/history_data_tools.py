@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+
+# Max number of rename batches that can be undone
+HISTORY_MAX_BATCHES = 20
+# Folder with the file of each batch, next to the history file: the name
+# of the history file without extension plus this
+HISTORY_BATCHES_SUFFIX = "_batches"
+
+
+class RenameBatch:
+    """
+    The renames of one batch, in the order they were done.
+
+    The folders are kept once in a table and each rename only has the
+    index of its folders and the names, so big batches of items in the
+    same folders take little space. Each rename also keeps the inode of
+    the item (None when unknown), to know if the item at the path is
+    still the same one when undoing or redoing.
+    """
+
+    def __init__(self, dirs=None, renames=None):
+        # Table of the folders of the renames
+        self.dirs = dirs if dirs is not None else []
+        # [(old folder index, old name, new folder index, new name, inode)]
+        self.renames = renames if renames is not None else []
+        self._dir_indexes = {
+            directory: i for i, directory in enumerate(self.dirs)
+        }
+
+    def _dir_index_get(self, directory):
+        """Returns the index of the folder in the table, adding it if new"""
+        try:
+            return self._dir_indexes[directory]
+        except KeyError:
+            self.dirs.append(directory)
+            index = self._dir_indexes[directory] = len(self.dirs) - 1
+            return index
+
+    def append(self, old_path, new_path, inode=None):
+        """Adds a rename done"""
+        old_dir, old_name = os.path.split(old_path)
+        new_dir, new_name = os.path.split(new_path)
+        self.renames.append(
+            (
+                self._dir_index_get(old_dir),
+                old_name,
+                self._dir_index_get(new_dir),
+                new_name,
+                inode,
+            )
+        )
+
+    def pairs_get(self):
+        """
+        Returns the list of (old_path, new_path, inode) of the renames, in
+        the order they were done
+        """
+        dirs = self.dirs
+        return [
+            (
+                os.path.join(dirs[old_dir], old_name),
+                os.path.join(dirs[new_dir], new_name),
+                inode,
+            )
+            for old_dir, old_name, new_dir, new_name, inode in self.renames
+        ]
+
+    def __len__(self):
+        return len(self.renames)
+
+    def to_dict(self):
+        return {"dirs": self.dirs, "renames": self.renames}
+
+    @classmethod
+    def from_dict(cls, batch_dict):
+        """
+        Returns the batch saved with to_dict. Raises KeyError, TypeError,
+        ValueError or IndexError when the dict isn't a saved batch
+        """
+        dirs = [str(directory) for directory in batch_dict["dirs"]]
+        renames = []
+        for old_dir, old_name, new_dir, new_name, inode in batch_dict[
+            "renames"
+        ]:
+            old_dir, new_dir = int(old_dir), int(new_dir)
+            if not (0 <= old_dir < len(dirs) and 0 <= new_dir < len(dirs)):
+                raise IndexError("Folder index out of the table")
+            renames.append(
+                (old_dir, str(old_name), new_dir, str(new_name), inode)
+            )
+
+        return cls(dirs, renames)
+
+
+class RenameHistory:
+    """
+    Undo and redo stacks of rename batches, saved to a file (when a path
+    is given) every time they change, so they are kept between sessions.
+    Only the last max_batches batches can be undone.
+
+    The file only has the ids of the batches in each stack, each batch is
+    saved in its own file (in the folder HISTORY_BATCHES_SUFFIX next to
+    it) once. So undoing and redoing only rewrite the small file of the
+    stacks, however big the batches are.
+    """
+
+    def __init__(self, path=None, max_batches=HISTORY_MAX_BATCHES):
+        self.path = path
+        self.max_batches = max_batches
+        self.undo_stack = []
+        self.redo_stack = []
+        # {batch: id} of the batches already saved in their file
+        self._batch_ids = {}
+        self._next_id = 0
+        self._load()
+
+    def _batches_dir_get(self):
+        return os.path.splitext(self.path)[0] + HISTORY_BATCHES_SUFFIX
+
+    def _batch_path_get(self, batch_id):
+        return os.path.join(self._batches_dir_get(), f"{batch_id}.json")
+
+    def _load(self):
+        """
+        Loads the stacks saved. When the file is broken in any way the
+        history starts empty, it never stops the program from starting
+        """
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                history_dict = json.load(f)
+            undo_stack = list(map(self._batch_load, history_dict["undo"]))
+            redo_stack = list(map(self._batch_load, history_dict["redo"]))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as error:
+            logging.warning(
+                f"Couldn't load the rename history, starting with an empty "
+                f"one: {error!r}"
+            )
+            self._batch_ids.clear()
+            return
+
+        self.undo_stack = [batch for batch in undo_stack if batch is not None]
+        self.redo_stack = [batch for batch in redo_stack if batch is not None]
+        if self._batch_ids:
+            self._next_id = max(self._batch_ids.values()) + 1
+        logging.debug(
+            f"Loaded rename history with {len(self.undo_stack)} undos and "
+            f"{len(self.redo_stack)} redos"
+        )
+
+    def _batch_load(self, batch_entry):
+        """
+        Returns the batch of an entry of the stacks: the id of its file,
+        or the batch itself in the files of older versions. None when its
+        file can't be loaded
+        """
+        if isinstance(batch_entry, dict):
+            return RenameBatch.from_dict(batch_entry)
+
+        batch_id = int(batch_entry)
+        try:
+            with open(
+                self._batch_path_get(batch_id), "r", encoding="utf-8"
+            ) as f:
+                batch = RenameBatch.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as error:
+            logging.warning(
+                f"Couldn't load the rename history batch {batch_id}: "
+                f"{error!r}"
+            )
+            return None
+
+        self._batch_ids[batch] = batch_id
+        return batch
+
+    def save(self):
+        """
+        Saves the batches that aren't saved yet and the stacks, replacing
+        the file atomically. Then removes the files of the batches that
+        are no longer in the stacks
+        """
+        if self.path is None:
+            return
+
+        stacks = self.undo_stack + self.redo_stack
+        try:
+            for batch in stacks:
+                if batch not in self._batch_ids:
+                    self._batch_save(batch)
+
+            _json_replace(
+                self.path,
+                {
+                    "undo": [
+                        self._batch_ids[batch] for batch in self.undo_stack
+                    ],
+                    "redo": [
+                        self._batch_ids[batch] for batch in self.redo_stack
+                    ],
+                },
+            )
+        except OSError as error:
+            logging.error(f"Couldn't save the rename history: {error}")
+            return
+
+        for batch in set(self._batch_ids) - set(stacks):
+            try:
+                os.remove(self._batch_path_get(self._batch_ids.pop(batch)))
+            except OSError as error:
+                logging.debug(f"Couldn't remove a history batch: {error}")
+
+    def _batch_save(self, batch):
+        """Saves a batch in its own file, giving it the next id"""
+        os.makedirs(self._batches_dir_get(), exist_ok=True)
+        batch_id = self._next_id
+        _json_replace(self._batch_path_get(batch_id), batch.to_dict())
+        self._batch_ids[batch] = batch_id
+        self._next_id += 1
+
+    def push(self, batch):
+        """
+        Adds a new batch that can be undone. The batches that could be
+        redone are forgotten
+        """
+        if not batch:
+            return
+
+        self.undo_stack.append(batch)
+        del self.undo_stack[: -self.max_batches]
+        self.redo_stack.clear()
+        self.save()
+
+    def undo_pop(self):
+        """
+        Returns the last batch to undo it (moving it to the redo stack),
+        or None if there is nothing to undo
+        """
+        if not self.undo_stack:
+            return None
+
+        batch = self.undo_stack.pop()
+        self.redo_stack.append(batch)
+        self.save()
+        return batch
+
+    def redo_pop(self):
+        """
+        Returns the last undone batch to redo it (moving it back to the
+        undo stack), or None if there is nothing to redo
+        """
+        if not self.redo_stack:
+            return None
+
+        batch = self.redo_stack.pop()
+        self.undo_stack.append(batch)
+        self.save()
+        return batch
+
+
+def _json_replace(path, obj):
+    """Writes the object as JSON to the path, replacing it atomically"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def history_schedule_get(batch, undo=True):
+    """
+    Returns the renames to undo (or redo) a batch, in order, as a list of
+    (old_path, new_path) to pass to rename_system_rename_batch, and the
+    list of inodes each old path should have, so the items that changed
+    since are skipped
+    """
+    pairs = batch.pairs_get()
+    if undo:
+        pairs = [(new, old, inode) for old, new, inode in reversed(pairs)]
+
+    schedule = [(old_path, new_path) for old_path, new_path, _ in pairs]
+    inodes = [inode for _, _, inode in pairs]
+
+    return schedule, inodes
@@ -0,0 +1,182 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+# Number of records kept in memory before writing them to the journal
+JOURNAL_FLUSH_EVERY = 1024
+# Max seconds between syncs of the journal to the disk while renaming.
+# 0 syncs after every rename, which is the safest and slowest
+JOURNAL_FSYNC_INTERVAL = 1.0
+
+# Kinds of records (the first item of each line)
+_RECORD_BEGIN = "B"
+_RECORD_PLAN = "P"
+_RECORD_DONE = "D"
+_RECORD_END = "E"
+
+# A batch found in the journal: the renames in the order they were to be
+# done (the plan) and the indexes of the ones recorded as done
+JournalBatch = collections.namedtuple("JournalBatch", ("schedule", "done"))
+
+
+class RenameJournal:
+    """
+    Write-ahead journal of a rename batch, so a batch interrupted by a
+    crash or a power loss can be finished or rolled back the next time.
+
+    The journal is a file with a JSON list per line. The whole plan is
+    written and synced to the disk before renaming anything, then each
+    rename done is recorded by its index in the plan. The records are
+    written in groups of JOURNAL_FLUSH_EVERY and synced at most every
+    fsync_interval seconds. When the batch ends the journal is removed,
+    so if the file exists when starting the program the last batch was
+    interrupted.
+
+    Recording renames is thread safe.
+    """
+
+    def __init__(self, path, fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._buffer = []
+        self._last_fsync = 0
+        self._lock = threading.Lock()
+
+    def begin(self, schedule):
+        """
+        Records the plan, a list of (old_path, new_path) in the order to
+        rename them, and syncs it to the disk
+        """
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._record([_RECORD_BEGIN, time.time()])
+        for old_path, new_path in schedule:
+            self._record([_RECORD_PLAN, old_path, new_path])
+        self._flush(fsync=True)
+
+        logging.debug(
+            f'Journal "{self.path}" started with {len(schedule)} renames'
+        )
+
+    def done(self, index):
+        """Records that the rename at index in the plan was done"""
+        with self._lock:
+            self._record([_RECORD_DONE, index])
+
+            fsync = time.monotonic() - self._last_fsync >= self.fsync_interval
+            if fsync or len(self._buffer) >= JOURNAL_FLUSH_EVERY:
+                self._flush(fsync=fsync)
+
+    def end(self):
+        """The batch finished: the journal isn't needed anymore"""
+        self._record([_RECORD_END])
+        self._flush(fsync=True)
+        self._file.close()
+        self._file = None
+        journal_remove(self.path)
+
+    def _record(self, record):
+        # Paths can have any char, JSON escapes the newlines
+        self._buffer.append(json.dumps(record, ensure_ascii=False))
+
+    def _flush(self, fsync=False):
+        """Writes the buffered records, syncing them to the disk"""
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+        self._file.flush()
+
+        if fsync:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+
+def journal_batch_get(path):
+    """
+    Returns the JournalBatch of an interrupted batch in the journal, or
+    None when there is no journal (or the batch ended).
+
+    A crash can leave the last line half written, so lines that can't be
+    read are skipped
+    """
+    schedule = []
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if record[0] == _RECORD_PLAN:
+                    schedule.append((record[1], record[2]))
+                elif record[0] == _RECORD_DONE:
+                    done.add(record[1])
+                elif record[0] == _RECORD_END:
+                    return None
+    except FileNotFoundError:
+        return None
+
+    return JournalBatch(schedule, done)
+
+
+def journal_recover(path, rename, roll_back=False):
+    """
+    Finishes or rolls back (roll_back=True) the interrupted batch in the
+    journal, renaming with rename(old_path, new_path) which returns None
+    on success or an error message. Then removes the journal.
+
+    The last renames done could be missing from the journal (they weren't
+    synced), so for the renames not recorded as done the file system
+    decides: a rename is done when its old path is gone and its new path
+    exists.
+
+    Returns the list of error messages
+    """
+    batch = journal_batch_get(path)
+    if batch is None:
+        journal_remove(path)
+        return []
+
+    def _done(index, old_path, new_path):
+        return index in batch.done or (
+            not os.path.lexists(old_path) and os.path.lexists(new_path)
+        )
+
+    errors = []
+    if roll_back:
+        # Undo the renames done, last first
+        for index in reversed(range(len(batch.schedule))):
+            old_path, new_path = batch.schedule[index]
+            if _done(index, old_path, new_path):
+                error = rename(new_path, old_path)
+                if error is not None:
+                    errors.append(error)
+    else:
+        # Do the renames left, in order
+        for index, (old_path, new_path) in enumerate(batch.schedule):
+            if not _done(index, old_path, new_path) and not os.path.lexists(
+                new_path
+            ):
+                error = rename(old_path, new_path)
+                if error is not None:
+                    errors.append(error)
+
+    logging.info(
+        f'Journal "{path}" {"rolled back" if roll_back else "finished"} '
+        f"with {len(errors)} errors"
+    )
+    journal_remove(path)
+    return errors
+
+
+def journal_remove(path):
+    """Removes the journal file, if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
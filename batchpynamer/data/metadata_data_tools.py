@@ -1,5 +1,7 @@
+import concurrent.futures
 import logging
 import os
+import re
 
 from mutagen.easyid3 import EasyID3, EasyID3KeyError
 from mutagen.easymp4 import EasyMP4, EasyMP4KeyError
@@ -9,6 +11,19 @@ from mutagen.id3 import APIC, ID3
 from mutagen.mp3 import MP3
 
 import batchpynamer.data as bpn_data
+from batchpynamer.data.cache_data_tools import FileCache
+
+# Max number of files whose tags are remembered
+META_TAGS_CACHE_SIZE = 50_000
+# Max approximate size in bytes of all the remembered tags
+META_TAGS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Extensions of the audio files whose metadata can be read
+META_AUDIO_EXTS = (".flac", ".mp3", ".mp4")
+# Max number of files whose tags are read at the same time
+META_PREFETCH_MAX_WORKERS = 8
+
+# A metadata field in a name, like "{artist}"
+META_FIELD_RE = re.compile(r"\{([^{}]+)\}")
 
 
 def meta_audio_get(file):
@@ -26,6 +41,93 @@ def meta_audio_get(file):
     return meta_audio
 
 
+def _meta_tags_load(file):
+    """Returns a copy of the tags of the audio file, as a dict of lists"""
+    meta_audio = meta_audio_get(file)
+    return {key: list(meta_audio[key]) for key in meta_audio}
+
+
+def _meta_tags_size_get(meta_tags):
+    """Approximate size in bytes of the tags dict"""
+    # Rough overhead of each key and value objects
+    overhead = 64
+    return sum(
+        len(key) + overhead + sum(len(value) + overhead for value in values)
+        for key, values in meta_tags.items()
+    )
+
+
+# Tags of the audio files, shared by everything that only reads them.
+# Reused while the modification time and size of each file don't change
+_meta_tags_cache = FileCache(
+    _meta_tags_load,
+    META_TAGS_CACHE_SIZE,
+    max_bytes=META_TAGS_CACHE_MAX_BYTES,
+    size_get=_meta_tags_size_get,
+)
+
+
+def meta_tags_get(file):
+    """
+    Returns the tags of the audio file as a {tag: [values]} dict, or None
+    if it isn't an audio file.
+
+    The tags are cached, so reading them again is free while the file
+    doesn't change. The dict is shared, don't modify it (use
+    meta_audio_get to change the tags)
+    """
+    if not file.endswith(META_AUDIO_EXTS):
+        return None
+
+    return _meta_tags_cache.get(file)
+
+
+def meta_fields_get(name):
+    """Returns the set of metadata fields in the name, like {"artist"}"""
+    return set(META_FIELD_RE.findall(name))
+
+
+def meta_tags_prefetch(files, max_workers=META_PREFETCH_MAX_WORKERS):
+    """
+    Reads the tags of many audio files at the same time. Reading is
+    mostly waiting for the disk (mutagen releases the GIL then), so the
+    files are read in a thread pool and the time depends on the disk
+    instead of adding up the time of each file.
+
+    Returns a {file: tags} dict of the files that could be read, the
+    others are left out (reading them again raises their error). The tags
+    are also cached, see meta_tags_get
+    """
+    files = [file for file in set(files) if file.endswith(META_AUDIO_EXTS)]
+
+    def _meta_tags_try_get(file):
+        try:
+            return meta_tags_get(file)
+        except Exception as error:
+            logging.debug(f'Couldn\'t prefetch tags of "{file}": {error}')
+            return None
+
+    if len(files) > 1:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(max_workers, len(files))
+        ) as executor:
+            meta_tags_list = list(executor.map(_meta_tags_try_get, files))
+    else:
+        meta_tags_list = list(map(_meta_tags_try_get, files))
+
+    logging.debug(f"Prefetched the tags of {len(files)} files")
+    return {
+        file: meta_tags
+        for file, meta_tags in zip(files, meta_tags_list)
+        if meta_tags is not None
+    }
+
+
+def meta_tags_invalidate(file):
+    """Forgets the cached tags of the file, after changing it"""
+    _meta_tags_cache.invalidate(file)
+
+
 def meta_img_get(file):
     """
     Gets the attached picture from the metadata, if there is one, if not
@@ -81,6 +183,7 @@ def meta_audio_save(meta_audio, new_metadata_dict: dict):
                 pass
 
     meta_audio.save()
+    meta_tags_invalidate(meta_audio.filename)
     logging.debug(f"Metadata dict:\n{meta_audio}")
 
 
@@ -134,6 +237,7 @@ def meta_img_save(item, img=None, apic=None):
     elif item.endswith(".mp3"):
         meta_audio = ID3(item)
         meta_img_mp3_save(meta_audio, apic)
+    meta_tags_invalidate(item)
     logging.info(f'Added metadata image to "{item}"')
 
 
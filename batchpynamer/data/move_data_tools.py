@@ -0,0 +1,560 @@
+import concurrent.futures
+import errno
+import logging
+import os
+import shutil
+import stat
+import threading
+import time
+
+# Files from this size up are copied in chunks at the same time
+MOVE_PARALLEL_MIN_SIZE = 256 * 1024 * 1024
+# Size of each chunk of a file copied at the same time
+MOVE_CHUNK_SIZE = 64 * 1024 * 1024
+# Max number of chunks copied at the same time
+MOVE_MAX_WORKERS = 4
+# Min seconds between progress messages
+MOVE_PROGRESS_INTERVAL = 1.0
+
+# Errors of copy_file_range and sendfile when the file systems (or the
+# system) don't support them, the next way of copying is used then
+_COPY_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+}
+# Errors of copying an extended attribute that the file system (or the
+# user) can't have, the attribute is left out then
+_XATTR_SKIPPED_ERRNOS = {
+    errno.ENOTSUP,
+    errno.ENODATA,
+    errno.EINVAL,
+    errno.EPERM,
+    errno.EACCES,
+}
+
+# Not available in Windows, where the folders are copied by path
+_O_DIRECTORY = getattr(os, "O_DIRECTORY", 0)
+_O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+
+
+class MoveProgress:
+    """
+    Counts the bytes moved between file systems and logs the progress
+    every MOVE_PROGRESS_INTERVAL seconds. Thread safe.
+
+    callback(bytes_moved) is called with the progress too, from the
+    threads doing the copies.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.bytes_moved = 0
+        self._last_report = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, num_bytes):
+        with self._lock:
+            self.bytes_moved += num_bytes
+            now = time.monotonic()
+            report = now - self._last_report >= MOVE_PROGRESS_INTERVAL
+            if report:
+                self._last_report = now
+
+        if report:
+            logging.info(
+                f"Moved {self.bytes_moved / (1024 * 1024):.1f} MiB between "
+                "file systems"
+            )
+            if self.callback is not None:
+                self.callback(self.bytes_moved)
+
+
+def move_cross_device(
+    old_path,
+    new_path,
+    progress=None,
+    src_dir_fd=None,
+    dst_dir_fd=None,
+    durable=False,
+):
+    """
+    Moves an item to another file system, where it can't just be renamed:
+    copies it (with its permissions, times and extended attributes) and
+    then removes the original. Never overwrites new_path.
+
+    The data is copied inside the kernel with copy_file_range, or
+    sendfile where that isn't supported, without going through Python.
+    Big files are copied in chunks at the same time. The original is only
+    removed once the copy has all its bytes.
+
+    The paths are relative to src_dir_fd and dst_dir_fd when given, like
+    in os.rename, so the move still works when their folders are renamed
+    meanwhile. When durable the copy is synced to the disk before the
+    original is removed.
+
+    progress is a MoveProgress to count the bytes moved.
+
+    Raises FileExistsError when new_path exists, and OSError for any other
+    error. When it fails the copy is removed and the original is left.
+    """
+    if progress is None:
+        progress = MoveProgress()
+
+    old_stat = os.lstat(old_path, dir_fd=src_dir_fd)
+    if stat.S_ISDIR(old_stat.st_mode):
+        _dir_move(
+            old_path,
+            new_path,
+            old_stat,
+            progress,
+            src_dir_fd,
+            dst_dir_fd,
+            durable,
+        )
+    else:
+        _item_copy(
+            old_path,
+            new_path,
+            old_stat,
+            progress,
+            src_dir_fd,
+            dst_dir_fd,
+            durable,
+        )
+        if durable:
+            _parent_fsync(new_path, dst_dir_fd)
+        os.unlink(old_path, dir_fd=src_dir_fd)
+
+    logging.debug(f'Moved "{old_path}" to another file system')
+
+
+def move_cross_device_at(
+    old_path, new_path, dir_fds, progress=None, durable=False
+):
+    """
+    Same as move_cross_device but relative to the folders of the paths,
+    taken from dir_fds (a DirFds)
+    """
+    old_dir, old_name = os.path.split(old_path)
+    new_dir, new_name = os.path.split(new_path)
+    src_dir_fd = dir_fds.get(old_dir)
+    dst_dir_fd = dir_fds.get(new_dir)
+
+    # Use the whole paths when a folder couldn't be opened
+    if src_dir_fd is None or dst_dir_fd is None:
+        move_cross_device(old_path, new_path, progress, durable=durable)
+    else:
+        move_cross_device(
+            old_name, new_name, progress, src_dir_fd, dst_dir_fd, durable
+        )
+
+
+def _dir_move(
+    old_path, new_path, old_stat, progress, src_dir_fd, dst_dir_fd, durable
+):
+    """Copies the whole folder and then removes the original"""
+    # Without folder fds (Windows) the folder is copied by path
+    if os.scandir not in os.supports_fd:
+        _dir_path_move(old_path, new_path, progress, durable)
+        return
+
+    # Fails if it exists, so nothing is overwritten
+    os.mkdir(new_path, dir_fd=dst_dir_fd)
+    try:
+        _dir_copy(
+            old_path,
+            new_path,
+            old_stat,
+            progress,
+            src_dir_fd,
+            dst_dir_fd,
+            durable,
+        )
+        if durable:
+            _parent_fsync(new_path, dst_dir_fd)
+    except OSError:
+        _tree_remove_quiet(new_path, dst_dir_fd)
+        raise
+
+    _tree_remove(old_path, src_dir_fd)
+
+
+def _dir_copy(
+    old_path, new_path, old_stat, progress, src_dir_fd, dst_dir_fd, durable
+):
+    """
+    Copies the contents of a folder into an empty one, and then its
+    metadata. Everything inside is reached through the fds of the folders
+    """
+    src_fd = _dir_open(old_path, src_dir_fd)
+    try:
+        dst_fd = _dir_open(new_path, dst_dir_fd)
+        try:
+            with os.scandir(src_fd) as entries:
+                for entry in entries:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                    if stat.S_ISDIR(entry_stat.st_mode):
+                        os.mkdir(entry.name, dir_fd=dst_fd)
+                        _dir_copy(
+                            entry.name,
+                            entry.name,
+                            entry_stat,
+                            progress,
+                            src_fd,
+                            dst_fd,
+                            durable,
+                        )
+                    else:
+                        _item_copy(
+                            entry.name,
+                            entry.name,
+                            entry_stat,
+                            progress,
+                            src_fd,
+                            dst_fd,
+                            durable,
+                        )
+
+            # After the contents, as copying them changes the times
+            _metadata_copy(src_fd, dst_fd, old_stat)
+            if durable:
+                os.fsync(dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+def _dir_path_move(old_path, new_path, progress, durable):
+    """Copies the whole folder by path and then removes the original"""
+    # Fails if it exists, so nothing is overwritten
+    os.mkdir(new_path)
+    try:
+        shutil.copytree(
+            old_path,
+            new_path,
+            symlinks=True,
+            copy_function=lambda src, dst: _item_copy(
+                src, dst, os.lstat(src), progress, durable=durable
+            ),
+            dirs_exist_ok=True,
+        )
+    except (OSError, shutil.Error) as error:
+        shutil.rmtree(new_path, ignore_errors=True)
+        # shutil.Error collects the errors of each file
+        if isinstance(error, shutil.Error):
+            raise OSError(errno.EIO, str(error), old_path) from error
+        raise
+
+    shutil.rmtree(old_path)
+
+
+def _dir_open(path, dir_fd=None):
+    """Opens a folder, never following a link"""
+    return os.open(
+        path, os.O_RDONLY | _O_DIRECTORY | _O_NOFOLLOW, dir_fd=dir_fd
+    )
+
+
+def _tree_remove(path, dir_fd=None):
+    """Removes an item, with everything inside when it's a folder"""
+    if not stat.S_ISDIR(os.lstat(path, dir_fd=dir_fd).st_mode):
+        os.unlink(path, dir_fd=dir_fd)
+        return
+
+    fd = _dir_open(path, dir_fd)
+    try:
+        with os.scandir(fd) as entries:
+            names = [entry.name for entry in entries]
+        for name in names:
+            _tree_remove(name, fd)
+    finally:
+        os.close(fd)
+
+    os.rmdir(path, dir_fd=dir_fd)
+
+
+def _tree_remove_quiet(path, dir_fd=None):
+    """Removes an incomplete copy, its errors are only logged"""
+    try:
+        _tree_remove(path, dir_fd)
+    except OSError as error:
+        logging.error(
+            f'Couldn\'t remove the incomplete copy "{path}": {error}'
+        )
+
+
+def _parent_fsync(path, dir_fd=None):
+    """
+    Syncs the folder of the path to the disk, so the new item in it
+    survives a crash. dir_fd is the folder when the path is relative to it
+    """
+    try:
+        if dir_fd is not None:
+            os.fsync(dir_fd)
+            return
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | _O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    # Not every system can sync folders (like Windows)
+    except OSError as error:
+        logging.warning(f'Couldn\'t sync the folder of "{path}": {error}')
+
+
+def _item_copy(
+    old_path,
+    new_path,
+    old_stat,
+    progress,
+    src_dir_fd=None,
+    dst_dir_fd=None,
+    durable=False,
+):
+    """
+    Copies a file or a link, with its metadata. Fails when the copy
+    doesn't end up with all the bytes of the file
+    """
+    if stat.S_ISLNK(old_stat.st_mode):
+        os.symlink(
+            os.readlink(old_path, dir_fd=src_dir_fd),
+            new_path,
+            dir_fd=dst_dir_fd,
+        )
+        try:
+            _link_metadata_copy(new_path, old_stat, dst_dir_fd)
+        except OSError:
+            os.unlink(new_path, dir_fd=dst_dir_fd)
+            raise
+        return
+
+    # Opening fifos and devices would wait for them or read them forever
+    if not stat.S_ISREG(old_stat.st_mode):
+        raise OSError(
+            errno.EOPNOTSUPP,
+            "Special files can't be moved to another file system",
+            old_path,
+        )
+
+    src_fd = os.open(old_path, os.O_RDONLY | _O_NOFOLLOW, dir_fd=src_dir_fd)
+    try:
+        # O_EXCL fails if it exists, so nothing is overwritten
+        dst_fd = os.open(
+            new_path,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+            stat.S_IMODE(old_stat.st_mode),
+            dir_fd=dst_dir_fd,
+        )
+        try:
+            copied = _data_copy(src_fd, dst_fd, old_stat.st_size, progress)
+            # A file that got shorter (or longer) while copying leaves an
+            # incomplete copy, and the original can't be removed then
+            if (
+                copied != old_stat.st_size
+                or os.fstat(src_fd).st_size != old_stat.st_size
+            ):
+                raise OSError(
+                    errno.EIO,
+                    f"Copied {copied} of {old_stat.st_size} bytes, the file "
+                    "changed while moving it",
+                    old_path,
+                )
+            _metadata_copy(src_fd, dst_fd, old_stat, new_path, dst_dir_fd)
+            if durable:
+                os.fsync(dst_fd)
+        except OSError:
+            os.close(dst_fd)
+            os.unlink(new_path, dir_fd=dst_dir_fd)
+            raise
+        os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+def _metadata_copy(src_fd, dst_fd, old_stat, new_path=None, dst_dir_fd=None):
+    """
+    Copies the owner, permissions, extended attributes and times between
+    two open items. new_path is only used to set the times where they
+    can't be set through the fd (Windows)
+    """
+    # Only root can give the files to other users. Before the
+    # permissions, as changing the owner clears the setuid bits
+    if hasattr(os, "fchown"):
+        try:
+            os.fchown(dst_fd, old_stat.st_uid, old_stat.st_gid)
+        except PermissionError:
+            pass
+
+    if hasattr(os, "fchmod"):
+        os.fchmod(dst_fd, stat.S_IMODE(old_stat.st_mode))
+
+    _xattrs_copy(src_fd, dst_fd)
+
+    times = (old_stat.st_atime_ns, old_stat.st_mtime_ns)
+    if os.utime in os.supports_fd:
+        os.utime(dst_fd, ns=times)
+    elif new_path is not None:
+        os.utime(new_path, ns=times, dir_fd=dst_dir_fd)
+
+
+def _link_metadata_copy(new_path, old_stat, dst_dir_fd=None):
+    """Copies the owner and times of a link (links have no permissions)"""
+    try:
+        os.chown(
+            new_path,
+            old_stat.st_uid,
+            old_stat.st_gid,
+            dir_fd=dst_dir_fd,
+            follow_symlinks=False,
+        )
+    except (PermissionError, NotImplementedError):
+        pass
+    except AttributeError:  # Windows
+        pass
+
+    if os.utime in os.supports_follow_symlinks:
+        os.utime(
+            new_path,
+            ns=(old_stat.st_atime_ns, old_stat.st_mtime_ns),
+            dir_fd=dst_dir_fd,
+            follow_symlinks=False,
+        )
+
+
+def _xattrs_copy(src_fd, dst_fd):
+    """Copies the extended attributes that the copy can have"""
+    # Only Linux
+    if not hasattr(os, "listxattr"):
+        return
+
+    try:
+        names = os.listxattr(src_fd)
+    except OSError as error:
+        if error.errno in _XATTR_SKIPPED_ERRNOS:
+            return
+        raise
+
+    for name in names:
+        try:
+            os.setxattr(dst_fd, name, os.getxattr(src_fd, name))
+        except OSError as error:
+            if error.errno not in _XATTR_SKIPPED_ERRNOS:
+                raise
+
+
+def _data_copy(src_fd, dst_fd, size, progress):
+    """
+    Copies the contents of the file, in chunks at the same time if big
+    and copy_file_range works between both file systems.
+    Returns the number of bytes copied
+    """
+    if size < MOVE_PARALLEL_MIN_SIZE or not hasattr(os, "copy_file_range"):
+        return _range_copy(src_fd, dst_fd, 0, size, progress, sendfile=True)
+
+    # Copy the first chunk alone to know if copy_file_range works here
+    # (not between some file systems), else the chunks would be read and
+    # written by Python. Then sendfile copies the whole file in order
+    first = min(MOVE_CHUNK_SIZE, size)
+    try:
+        copied = _file_range_copy(src_fd, dst_fd, 0, first, progress)
+    except OSError as error:
+        if error.errno not in _COPY_UNSUPPORTED_ERRNOS:
+            raise
+        return _range_copy(src_fd, dst_fd, 0, size, progress, sendfile=True)
+    # The file got shorter
+    if copied < first:
+        return copied
+
+    # Set the size first so the chunks can be written in any order
+    os.ftruncate(dst_fd, size)
+    offsets = range(first, size, MOVE_CHUNK_SIZE)
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(MOVE_MAX_WORKERS, len(offsets))
+    ) as executor:
+        # Consume the results so errors are raised here
+        return copied + sum(
+            executor.map(
+                lambda offset: _range_copy(
+                    src_fd,
+                    dst_fd,
+                    offset,
+                    min(MOVE_CHUNK_SIZE, size - offset),
+                    progress,
+                ),
+                offsets,
+            )
+        )
+
+
+def _file_range_copy(src_fd, dst_fd, offset, length, progress):
+    """
+    Copies length bytes from offset of src_fd to the same offset of
+    dst_fd with copy_file_range, raising OSError when it isn't supported.
+
+    Returns the number of bytes copied, less than length when the file
+    got shorter
+    """
+    start = offset
+    end = offset + length
+    while offset < end:
+        copied = os.copy_file_range(
+            src_fd, dst_fd, end - offset, offset, offset
+        )
+        # The file got shorter
+        if not copied:
+            break
+        offset += copied
+        progress.add(copied)
+
+    return offset - start
+
+
+def _range_copy(src_fd, dst_fd, offset, length, progress, sendfile=False):
+    """
+    Copies length bytes from offset of src_fd to the same offset of
+    dst_fd. Uses copy_file_range, then sendfile (only when copying the
+    whole file in order, as it writes at the position of dst_fd) and then
+    reading and writing, the first that's supported.
+
+    Returns the number of bytes copied, less than length when the file
+    got shorter
+    """
+    start = offset
+    end = offset + length
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            return _file_range_copy(src_fd, dst_fd, offset, length, progress)
+        except OSError as error:
+            if error.errno not in _COPY_UNSUPPORTED_ERRNOS:
+                raise
+
+    if sendfile and hasattr(os, "sendfile"):
+        try:
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            while offset < end:
+                copied = os.sendfile(dst_fd, src_fd, offset, end - offset)
+                if not copied:
+                    break
+                offset += copied
+                progress.add(copied)
+            return offset - start
+        except OSError as error:
+            if error.errno not in _COPY_UNSUPPORTED_ERRNOS:
+                raise
+
+    while offset < end:
+        data = os.pread(src_fd, min(MOVE_CHUNK_SIZE, end - offset), offset)
+        if not data:
+            break
+        written = 0
+        while written < len(data):
+            written += os.pwrite(dst_fd, data[written:], offset + written)
+        offset += len(data)
+        progress.add(len(data))
+
+    return offset - start
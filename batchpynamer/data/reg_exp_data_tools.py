@@ -0,0 +1,179 @@
+import contextlib
+import functools
+import logging
+import re  # regular expressions
+import signal
+import threading
+
+# Number of compiled regular expression renames kept at the same time
+REG_EXP_CACHE_SIZE = 32
+# Max seconds matching names can take: the base budget plus the budget of
+# each name matched at once. A pattern that takes longer (catastrophic
+# backtracking) stops the renaming with RegExpTimeoutError
+REG_EXP_TIME_BUDGET = 1.0
+REG_EXP_NAME_TIME_BUDGET = 0.001
+
+# A group reference in the replace template: "/<name>" or "/<n>" for a
+# named or numbered group, "/n" for a numbered group
+_TEMPLATE_GROUP_REG_EXP = re.compile(r"/(?:<(\w+)>|(\d+))")
+
+
+class RegExpTimeoutError(Exception):
+    """Matching the names took longer than the time budget"""
+
+
+def _time_budget_handler(signum, frame):
+    raise RegExpTimeoutError
+
+
+@contextlib.contextmanager
+def _time_budget(seconds):
+    """
+    Interrupts the code inside after the seconds pass, raising
+    RegExpTimeoutError.
+
+    The re module checks for signals while matching, so an alarm can stop
+    a match that would take forever. Signals only work in the main thread
+    (and not in every platform), everywhere else there is no time budget.
+    """
+    if (
+        not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    old_handler = signal.signal(signal.SIGALRM, _time_budget_handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+
+
+class RegExpRename:
+    """
+    A regular expression to match and the template to recreate the name
+    with, both compiled once.
+
+    In the template "/n" is replaced by the nth group of the match, taking
+    the longest number that is a group of the pattern ("/10" is group 10
+    when the pattern has 10 groups, group 1 followed by a 0 otherwise).
+    "/<name>" is replaced by the group with that name (or number). Group
+    references that aren't groups of the pattern are kept as they are,
+    and groups that didn't match are replaced by nothing.
+
+    Renaming raises RegExpTimeoutError when the names take longer than
+    their time budget (see REG_EXP_TIME_BUDGET), every call gets its own
+    budget.
+
+    Raises re.error when the pattern isn't a valid regular expression.
+    """
+
+    def __init__(self, match_reg, replace_with):
+        self.pattern = re.compile(match_reg)
+        self.replace_with = replace_with
+
+        # The template as the text before each group, the groups, and the
+        # text after the last group
+        self._texts = []
+        self._groups = []
+        self._last_text = self._template_compile(replace_with)
+
+    def _group_ref_get(self, named, numbered):
+        """
+        Returns the group a reference in the template points to and the
+        text after the reference that isn't part of it. Or (None, None)
+        when it isn't a group of the pattern
+        """
+        if named is not None:
+            if named.isdigit():
+                if int(named) <= self.pattern.groups:
+                    return int(named), ""
+            elif named in self.pattern.groupindex:
+                return named, ""
+            return None, None
+
+        # The longest number that is a group
+        for end in range(len(numbered), 0, -1):
+            if int(numbered[:end]) <= self.pattern.groups:
+                return int(numbered[:end]), numbered[end:]
+
+        return None, None
+
+    def _template_compile(self, replace_with):
+        """
+        Splits the template into its texts and groups. Returns the text
+        after the last group
+        """
+        text_start = 0
+        # The text pending since the last group
+        pending = ""
+        for ref in _TEMPLATE_GROUP_REG_EXP.finditer(replace_with):
+            group, rest = self._group_ref_get(*ref.groups())
+            if group is None:
+                continue
+
+            self._texts.append(
+                pending + replace_with[text_start : ref.start()]
+            )
+            self._groups.append(group)
+            pending = rest
+            text_start = ref.end()
+
+        return pending + replace_with[text_start:]
+
+    def _rename_match(self, name):
+        """
+        Recreates the name from the template with the groups of the match.
+        When the name doesn't match the template is the name as it is
+        """
+        reg_grouping = self.pattern.match(name)
+
+        if reg_grouping is None:
+            return self.replace_with
+
+        pieces = []
+        for text, group in zip(self._texts, self._groups):
+            pieces.append(text)
+            pieces.append(reg_grouping.group(group) or "")
+        pieces.append(self._last_text)
+
+        return "".join(pieces)
+
+    def rename(self, name):
+        """Renames one name (see _rename_match) within its time budget"""
+        return self.rename_column((name,))[0]
+
+    def rename_column(self, names):
+        """
+        Renames a whole column of names, with a single time budget for all
+        of them that grows with the number of names. Raises
+        RegExpTimeoutError when it runs out, so the names are never half
+        renamed
+        """
+        names = list(names)
+        seconds = REG_EXP_TIME_BUDGET + REG_EXP_NAME_TIME_BUDGET * len(names)
+        try:
+            with _time_budget(seconds):
+                return list(map(self._rename_match, names))
+        except RegExpTimeoutError:
+            error_msg = (
+                f'Regular expression "{self.pattern.pattern}" took more '
+                f"than {seconds:g}s to match {len(names)} names"
+            )
+            logging.warning(error_msg)
+            raise RegExpTimeoutError(error_msg) from None
+
+
+@functools.lru_cache(maxsize=REG_EXP_CACHE_SIZE)
+def reg_exp_rename_get(match_reg, replace_with):
+    """
+    Returns the RegExpRename for the pattern and template, compiling them
+    only the first time (every keystroke in the fields recreates the
+    rename plan, mostly with the same regular expression).
+
+    Raises re.error when the pattern isn't a valid regular expression.
+    """
+    return RegExpRename(match_reg, replace_with)
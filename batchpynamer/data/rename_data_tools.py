@@ -1,18 +1,83 @@
+import concurrent.futures
+import errno
+import itertools
 import logging
 import os
+from operator import methodcaller
 import re  # regular expressions
 import string
+import threading
 import unicodedata
 
 import batchpynamer as bpn
-from batchpynamer.data.metadata_data_tools import meta_audio_get
-
-
-def rename_system_rename(old_path, new_path):
+from batchpynamer import data as bpn_data
+from batchpynamer.data.cache_data_tools import (
+    FrozenKey,
+    MemoCache,
+    file_signature_get,
+)
+from batchpynamer.data.entry_data_tools import path_info_get
+from batchpynamer.data.error_report_data_tools import RenameError
+from batchpynamer.data.from_file_data_tools import from_file_lines_get
+from batchpynamer.data.metadata_data_tools import (
+    META_FIELD_RE,
+    meta_fields_get,
+    meta_tags_get,
+    meta_tags_prefetch,
+)
+from batchpynamer.data.move_data_tools import (
+    MoveProgress,
+    move_cross_device,
+    move_cross_device_at,
+)
+from batchpynamer.data.reg_exp_data_tools import reg_exp_rename_get
+from batchpynamer.data.system_rename_data_tools import (
+    DirFds,
+    rename_noreplace,
+    rename_noreplace_at,
+)
+from batchpynamer.data.replace_table_data_tools import (
+    casefold_with_positions,
+    replace_table_get,
+)
+
+# Reasons of the rename errors
+RENAME_EXISTS = "Path already exists"
+RENAME_NOT_FOUND = "File not found"
+RENAME_INVALID = "Invalid characters"
+RENAME_CHANGED = "Changed since it was renamed"
+# Reasons of the renames of a transactional batch that failed
+RENAME_ROLLED_BACK = "Rolled back"
+RENAME_NOT_DONE = "Not renamed"
+
+
+def rename_system_rename(old_path, new_path, dir_fds=None):
     """Rename files
 
+    When renaming many files pass a DirFds with their folders, so the
+    renames are done relative to the already opened folders.
+
     Returns None when successful. Otherwise returns and error message
     """
+    error = rename_system_rename_error_get(old_path, new_path, dir_fds)
+    if error is not None:
+        return error.msg
+
+    return None
+
+
+def rename_system_rename_error_get(
+    old_path, new_path, dir_fds=None, progress=None, durable=False
+):
+    """
+    Same as rename_system_rename but returns a RenameError when it fails,
+    with the errno and the reason apart from the message.
+
+    When the new path is in another file system the item is moved there
+    (see move_cross_device), counting the bytes in progress, a
+    MoveProgress. When durable the copy is synced to the disk before the
+    original is removed.
+    """
 
     # Only rename if the old name is different from the new name
     if old_path == new_path:
@@ -21,78 +86,400 @@ def rename_system_rename(old_path, new_path):
         )
         return None
 
-    if not os.path.exists(new_path):
+    try:
         try:
-            os.rename(old_path, new_path)
-        # Catch exceptions for invalid filenames
-        except OSError:
-            error_msg = f"Couldn't rename file {old_path}.\nInvalid characters"
-
-        except FileNotFoundError:
-            error_msg = f"Couldn't rename file {old_path}.\nFile not found"
-        # No errors
-        else:
-            logging.info(f"{old_path} -> {new_path}")
-            return None
-
+            # Never writes over an existing path
+            if dir_fds is None:
+                rename_noreplace(old_path, new_path)
+            else:
+                rename_noreplace_at(old_path, new_path, dir_fds)
+        except OSError as error:
+            # Can't rename to another file system, copy it there instead
+            if error.errno != errno.EXDEV:
+                raise
+            if dir_fds is None:
+                move_cross_device(
+                    old_path, new_path, progress, durable=durable
+                )
+            else:
+                move_cross_device_at(
+                    old_path, new_path, dir_fds, progress, durable
+                )
     # If path already exists don't write over it and skip it
-    else:
+    except FileExistsError as error:
+        error_errno = error.errno
+        reason = RENAME_EXISTS
         error_msg = (
             f'Couldn\'t rename file "{old_path}" to "{new_path}".\nPath alread'
             "y exists"
         )
+    except FileNotFoundError as error:
+        error_errno = error.errno
+        reason = RENAME_NOT_FOUND
+        error_msg = f"Couldn't rename file {old_path}.\nFile not found"
+    except OSError as error:
+        error_errno = error.errno
+        # Catch exceptions for invalid filenames
+        if error.errno in (errno.EINVAL, errno.EILSEQ):
+            reason = RENAME_INVALID
+        # Any other error of the system (permissions, disk full...)
+        else:
+            reason = os.strerror(error.errno) if error.errno else str(error)
+        error_msg = f"Couldn't rename file {old_path}.\n{reason}"
+    # No errors
+    else:
+        logging.info(f"{old_path} -> {new_path}")
+        return None
 
     logging.error(error_msg)
-    return error_msg
+    return RenameError(old_path, new_path, error_errno, reason, error_msg)
 
 
-def rename_generate_new_name(old_path, idx, fields_dict):
+def rename_new_path_get(old_path, new_name, into_folders=False):
     """
-    Iterates over each selected item and recreates each new name
-    following the renaming rules given inside the rename page of
-    the notebook.
+    Returns the new path of an item from its new name.
+
+    When into_folders the new name can have folders, relative to the
+    folder of the item (like "Artist/Album/Song.mp3"), to move the items
+    into them. The folders can only go down: the new name is never an
+    absolute path and its "." and ".." parts are dropped, as it can come
+    from tags or files. So the new path is always inside the folder of
+    the item.
     """
-    # Get the old name
-    old_name = os.path.basename(old_path)
-    # Transform the old name to the new name
-    return (
-        rename_create_new_name_action(old_name, idx, old_path, fields_dict),
-        old_path,
-    )
+    directory = os.path.dirname(old_path)
+    if not into_folders:
+        return os.path.join(directory, new_name)
+
+    # Without the drive (Windows) and the parts that go up or nowhere
+    parts = [
+        part
+        for part in _NEW_NAME_SEPARATORS_RE.split(
+            os.path.splitdrive(new_name)[1]
+        )
+        if part not in ("", os.curdir, os.pardir)
+    ]
+    return os.path.join(directory, *parts)
 
 
-def rename_create_new_name_action(name, idx, path, fields_dict):
+def rename_new_dirs_make(renames, durable=False, new_dirs=None):
+    """
+    Creates the folders the items are moved into, renames is a list of
+    (old_path, new_path). Each folder is created only once, however many
+    items go into it.
+
+    new_dirs is a list where every folder created is added, parents
+    first, so they can be removed again (see rename_new_dirs_remove).
+
+    When durable the folders where new folders were created are synced to
+    the disk, so the new folders survive a power loss (the batch only
+    syncs the folders the items are renamed in).
+
+    Returns the list of RenameError of the folders that couldn't be
+    created
+    """
+    directories = {
+        os.path.dirname(new_path)
+        for old_path, new_path in renames
+        if os.path.dirname(old_path) != os.path.dirname(new_path)
+    }
+
+    errors = []
+    # Folders holding the new folders
+    parents = set()
+    for directory in sorted(directories):
+        # The folders makedirs is going to create
+        missing = []
+        new_dir = directory
+        while new_dir and not os.path.lexists(new_dir):
+            parents.add(os.path.dirname(new_dir))
+            missing.append(new_dir)
+            new_dir = os.path.dirname(new_dir)
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as error:
+            # It may have failed halfway, keep the ones it did create
+            if new_dirs is not None:
+                new_dirs.extend(
+                    new_dir
+                    for new_dir in reversed(missing)
+                    if os.path.isdir(new_dir)
+                )
+            reason = os.strerror(error.errno) if error.errno else str(error)
+            error_msg = f"Couldn't create folder {directory}.\n{reason}"
+            logging.error(error_msg)
+            errors.append(
+                RenameError(directory, "", error.errno, reason, error_msg)
+            )
+        else:
+            if new_dirs is not None:
+                new_dirs.extend(reversed(missing))
+
+    logging.debug(f"Created {len(directories) - len(errors)} folders")
+
+    if durable:
+        with DirFds() as dir_fds:
+            for parent in sorted(parents):
+                dir_fds.fsync(parent)
+
+    return errors
+
+
+def rename_new_dirs_remove(new_dirs):
+    """
+    Removes the folders rename_new_dirs_make created (new_dirs), deepest
+    first, leaving the ones that aren't empty anymore.
+
+    Returns the set of folders removed
+    """
+    removed = set()
+    for new_dir in reversed(new_dirs):
+        try:
+            os.rmdir(new_dir)
+        except OSError as error:
+            logging.debug(f"Kept folder {new_dir}: {error}")
+        else:
+            removed.add(new_dir)
+
+    logging.debug(f"Removed {len(removed)} folders")
+
+    return removed
+
+
+def rename_system_rename_batch(
+    schedule,
+    journal=None,
+    inodes=None,
+    transactional=False,
+    durable=False,
+    new_dirs=(),
+):
+    """
+    Renames a whole batch, a list of (old_path, new_path) in the order
+    to rename them (see rename_schedule_get).
+
+    The renames are split into groups that don't depend on each other:
+    the ones in different folders (a rename that moves an item to another
+    folder joins both folders). As every folder is opened before starting
+    and the renames are done relative to them, the groups are renamed at
+    the same time in a thread pool, deepest folders first. Each group is
+    renamed in order. When there are more folders than can be open at
+    the same time (see DirFds) the whole batch is renamed in order.
+
+    With a RenameJournal the plan is recorded before renaming anything,
+    and then every rename done, so an interrupted batch can be recovered.
+
+    inodes is a list with the inode each old path should have (or None
+    to not check it), the items that aren't the same anymore are skipped.
+
+    When transactional it's all or nothing: it stops at the first rename
+    that fails and rolls back every rename already done, in reverse
+    order. Then the reason of the renames rolled back is
+    RENAME_ROLLED_BACK and of the ones not even tried RENAME_NOT_DONE,
+    the renames that couldn't be rolled back are left as done (None).
+    The folders in new_dirs (created for the batch by
+    rename_new_dirs_make) are removed after rolling back, if empty.
+
+    When durable every folder where something was renamed is synced to
+    the disk once at the end (before ending the journal), so the batch
+    survives a power loss with one sync per folder instead of per item.
+    Items moved to another file system are synced before their original
+    is removed.
+
+    Returns the results of rename_system_rename_error_get (None or a
+    RenameError) for each rename, in the same order as schedule
+    """
+    # Nothing to rename (no new name is different), so nothing to record
+    if not schedule:
+        return []
+
+    results = [None] * len(schedule)
+    groups = _rename_groups_get(schedule)
+    # Set on the first failure of a transactional batch, so every group
+    # stops
+    failed = threading.Event()
+    # Bytes moved to other file systems
+    progress = MoveProgress()
+
+    if journal is not None:
+        try:
+            journal.begin(schedule)
+        except OSError as error:
+            logging.error(f"Couldn't start the rename journal: {error}")
+            journal = None
+
+    # Open every folder once, before any of them is renamed
+    with DirFds(
+        (os.path.dirname(path) for pair in schedule for path in pair),
+        sync=durable,
+    ) as dir_fds:
+
+        def _group_rename(group):
+            for i in group:
+                old_path, new_path = schedule[i]
+                if failed.is_set():
+                    results[i] = RenameError(
+                        old_path,
+                        new_path,
+                        None,
+                        RENAME_NOT_DONE,
+                        f"{old_path} wasn't renamed",
+                    )
+                    continue
+                if inodes is not None and not _inode_check(
+                    old_path, inodes[i], dir_fds
+                ):
+                    error_msg = (
+                        f'Couldn\'t rename file "{old_path}".\nIt changed '
+                        "since it was renamed"
+                    )
+                    logging.warning(error_msg)
+                    results[i] = RenameError(
+                        old_path, new_path, None, RENAME_CHANGED, error_msg
+                    )
+                else:
+                    results[i] = rename_system_rename_error_get(
+                        old_path, new_path, dir_fds, progress, durable
+                    )
+                if results[i] is None:
+                    if journal is not None:
+                        journal.done(i)
+                elif transactional:
+                    failed.set()
+
+        # When a folder couldn't be opened the whole paths are used, and
+        # those change when their folders are renamed, so keep the order
+        if len(groups) <= 1 or not dir_fds.all_opened():
+            _group_rename(range(len(schedule)))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(RENAME_MAX_WORKERS, len(groups))
+            ) as executor:
+                # Consume the results so errors are raised here
+                list(executor.map(_group_rename, groups))
+
+        removed = set()
+        if failed.is_set():
+            _rename_roll_back(schedule, results, dir_fds)
+            removed = rename_new_dirs_remove(new_dirs)
+
+        if durable:
+            _rename_dirs_fsync(schedule, results, dir_fds, removed)
+
+    if journal is not None:
+        journal.end()
+
+    return results
+
+
+def _rename_roll_back(schedule, results, dir_fds):
+    """
+    Undoes the renames done of a batch (the ones with a None result), in
+    reverse order, marking them as RENAME_ROLLED_BACK
+    """
+    logging.warning("Rename failed, rolling back the renames done")
+    for i in reversed(range(len(schedule))):
+        if results[i] is None:
+            old_path, new_path = schedule[i]
+            if rename_system_rename(new_path, old_path, dir_fds) is None:
+                results[i] = RenameError(
+                    old_path,
+                    new_path,
+                    None,
+                    RENAME_ROLLED_BACK,
+                    f"{old_path} -> {new_path} was rolled back",
+                )
+
+
+def _rename_dirs_fsync(schedule, results, dir_fds, removed=()):
+    """
+    Syncs once each folder changed by the batch: the folders of the
+    renames done or rolled back. The folders removed are replaced by the
+    folders that held them
+    """
+    directories = {
+        os.path.dirname(path)
+        for pair, result in zip(schedule, results)
+        if result is None or result.reason == RENAME_ROLLED_BACK
+        for path in pair
+    }
+    directories.update(os.path.dirname(new_dir) for new_dir in removed)
+    directories.difference_update(removed)
+    logging.debug(f"Syncing {len(directories)} folders")
+
+    if len(directories) > 1:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(RENAME_MAX_WORKERS, len(directories))
+        ) as executor:
+            list(executor.map(dir_fds.fsync, directories))
+    else:
+        for directory in directories:
+            dir_fds.fsync(directory)
+
+
+def _inode_check(path, inode, dir_fds):
+    """
+    Checks the item at path is the one with the inode. When inode is None
+    only checks the path exists
+    """
+    directory, name = os.path.split(path)
+    dir_fd = dir_fds.get(directory)
+    try:
+        if dir_fd is None:
+            path_stat = os.stat(path, follow_symlinks=False)
+        else:
+            path_stat = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+    except OSError:
+        return False
+
+    return inode is None or path_stat.st_ino == inode
+
+
+def _rename_groups_get(schedule):
+    """
+    Splits the renames into groups of renames in the same folders.
+    Returns a list of lists of indexes of schedule, the groups of the
+    deepest folders first
+    """
+    # Union find of the folders that have renames between them
+    parents = {}
+
+    def _root_get(directory):
+        parents.setdefault(directory, directory)
+        while parents[directory] != directory:
+            parents[directory] = parents[parents[directory]]
+            directory = parents[directory]
+        return directory
+
+    for old_path, new_path in schedule:
+        old_root = _root_get(os.path.dirname(old_path))
+        new_root = _root_get(os.path.dirname(new_path))
+        if old_root != new_root:
+            parents[new_root] = old_root
+
+    # {root folder: [indexes]}, in the order of the schedule
+    groups = {}
+    for i, (old_path, new_path) in enumerate(schedule):
+        groups.setdefault(_root_get(os.path.dirname(old_path)), []).append(i)
+
+    return [
+        groups[root]
+        for root in sorted(
+            groups, key=lambda root: root.count(os.sep), reverse=True
+        )
+    ]
+
+
+def rename_create_new_name_action(
+    name, idx, path, fields_dict, entries_info=None
+):
     """
     Creates the new name going through all fields and making the changes
     to the old_name string
+
+    Compiles the fields for just this one name, when renaming a whole
+    selection create a RenamePlan once and call its apply method instead
     """
-    # Separate name and extension
-    ext = ""
-    if os.path.isfile(path):
-        name, ext = rename_ext_split_action(name)
-
-    name = rename_from_file_action(name, idx, fields_dict)
-    name = rename_reg_exp_action(name, fields_dict)
-    name = rename_name_basic_action(name, fields_dict)
-    name = rename_replace_action(name, fields_dict)
-    name = rename_case_change_action(name, fields_dict)
-    name = rename_remove_action(name, fields_dict)
-    name = rename_move_copy_text_action(name, fields_dict)
-    name = rename_add_action(name, fields_dict)
-    name = rename_add_folder_rename_action(name, path, fields_dict)
-    name = rename_numbering_action(name, idx, fields_dict)
-
-    ext = rename_ext_action(ext, fields_dict)
-    # Re-add extension
-    name = name.strip() + ext.strip()
-
-    # Format any metadata fields that have been added to the name
-    # (only if the metadata modules were imported)
-    if bpn.METADATA_IMPORT:
-        name = rename_metadata_format_action(name, path)
-
-    # Remove leading and trailing whitespaces
-    return name
+    return RenamePlan(fields_dict).apply(name, idx, path, entries_info)
 
 
 def rename_ext_split_action(name):
@@ -111,42 +498,441 @@ def rename_ext_split_action(name):
     return name, ext
 
 
+class RenamePlan:
+    """
+    The rename fields compiled once for a whole selection.
+
+    Reading fields_dict, normalizing the options and compiling the regular
+    expressions only depends on the fields, not on the item being renamed,
+    so its done once here. Stages that wouldn't change anything (the
+    default field values) are left out of the plan.
+
+    Each stage is a function with the signature stage(name, idx, path)
+    that returns the changed name. Stages that can work on the whole
+    selection at once also have a "column" attribute with the signature
+    column(names, idxs, paths) that returns the list of changed names.
+    Stages raise RegExpTimeoutError when the regular expression takes too
+    long, and then there is no new name.
+    """
+
+    def __init__(self, fields_dict):
+        self.fields_dict = fields_dict
+
+        # What the result of each stage depends on
+        self.stage_keys = {
+            stage_name: _stage_key_get(stage_name, fields_dict)
+            for stage_name in bpn_data.RENAME_ORDER
+        }
+
+        # Stages that change the name (without the extension), in order,
+        # and their names in RENAME_ORDER
+        self.stages = []
+        self.stage_names = []
+        for stage_name in bpn_data.RENAME_ORDER:
+            # The extension is changed separately from the name
+            if stage_name == "ext_replace":
+                continue
+            stage = RENAME_STAGE_COMPILERS[stage_name](fields_dict)
+            if stage is not None:
+                self.stages.append(stage)
+                self.stage_names.append(stage_name)
+
+        self.ext_stage = rename_ext_compile(fields_dict)
+
+        # Besides the name, whether the new name depends on the index and
+        # the path of the item
+        self.uses_idx = not RENAME_STAGES_USING_IDX.isdisjoint(
+            self.stage_names
+        )
+        self.uses_path = not RENAME_STAGES_USING_PATH.isdisjoint(
+            self.stage_names
+        )
+        # All the fields frozen, to look up the already generated names
+        self.key = FrozenKey(tuple(self.stage_keys.values()))
+
+    def apply(self, name, idx, path, entries_info=None):
+        """
+        Creates the new name going through all the active stages and
+        making the changes to the old name string.
+
+        New names already generated with the same fields for the same
+        name (and the same index and path, only when a stage uses them)
+        are reused from rename_memo.
+
+        entries_info is the {path: EntryInfo} of the file view, the path
+        is only stat'd when it isn't there
+        """
+        is_file = path_info_get(path, entries_info).is_file
+        # The fields are the group of the key in the memo
+        memo_key = (
+            name,
+            is_file,
+            idx if self.uses_idx else None,
+            path if self.uses_path else None,
+        )
+        new_name = rename_memo.lookup(self.key, memo_key, MemoCache.MISSING)
+        if new_name is MemoCache.MISSING:
+            new_name = self._stages_apply(name, idx, path, is_file)
+            rename_memo.put(self.key, memo_key, new_name)
+        name = new_name
+
+        # Format any metadata fields that have been added to the name
+        # (only if the metadata modules were imported)
+        if bpn.METADATA_IMPORT:
+            name = rename_metadata_format_action(name, path)
+
+        return name
+
+    def _stages_apply(self, name, idx, path, is_file):
+        """Goes through all the active stages for one name"""
+        # Separate name and extension
+        ext = ""
+        if is_file:
+            name, ext = rename_ext_split_action(name)
+
+        for stage in self.stages:
+            name = stage(name, idx, path)
+
+        if self.ext_stage is not None:
+            ext = self.ext_stage(ext, idx, path)
+        # Re-add extension, removing leading and trailing whitespaces
+        return name.strip() + ext.strip()
+
+    def apply_column(self, names, idxs, paths, entries_info=None):
+        """
+        Same as apply but for a whole column of names at once. Each stage
+        goes over all the names before the next one starts, using its
+        column version when it has one
+        """
+        names = list(names)
+        is_files = self.is_files_get(paths, entries_info)
+
+        memo_keys = self.memo_keys_get(names, idxs, paths, is_files)
+        new_names = rename_memo.lookup_many(self.key, memo_keys)
+        if new_names is None:
+            names, exts = self.split_column(names, is_files)
+
+            for stage in self.stages:
+                names = _stage_column_run(stage, names, idxs, paths)
+
+            if self.ext_stage is not None:
+                exts = _stage_column_run(self.ext_stage, exts, idxs, paths)
+
+            new_names = self.join_column(names, exts)
+            rename_memo.put_many(self.key, memo_keys, new_names)
+
+        return self.meta_format_column(new_names, paths)
+
+    def memo_keys_get(self, names, idxs, paths, is_files):
+        """
+        Returns the keys of a column of names in the group of the plan in
+        rename_memo, the same ones apply uses
+        """
+        if not self.uses_idx:
+            idxs = itertools.repeat(None)
+        if not self.uses_path:
+            paths = itertools.repeat(None)
+
+        return [
+            (name, is_file, idx, path)
+            for name, is_file, idx, path in zip(names, is_files, idxs, paths)
+        ]
+
+    @staticmethod
+    def is_files_get(paths, entries_info=None):
+        """Returns whether each path is a file, the ones with extension"""
+        return [path_info_get(path, entries_info).is_file for path in paths]
+
+    @staticmethod
+    def split_column(names, is_files):
+        """
+        Separates the names and extensions of a column of names. Returns
+        the list of names and the list of extensions
+        """
+        names = list(names)
+        exts = [""] * len(names)
+
+        for i, is_file in enumerate(is_files):
+            if is_file:
+                names[i], exts[i] = rename_ext_split_action(names[i])
+
+        return names, exts
+
+    @staticmethod
+    def join_column(names, exts):
+        """
+        Re-adds the extensions to a column of names, removing leading and
+        trailing whitespaces. Returns the list of new names
+        """
+        return list(
+            map(str.__add__, map(str.strip, names), map(str.strip, exts))
+        )
+
+    @staticmethod
+    def meta_format_column(names, paths):
+        """
+        Formats the metadata fields of a column of new names (only if the
+        metadata modules were imported). Returns the list of new names
+        """
+        if bpn.METADATA_IMPORT:
+            # Read the tags of all the items with fields in their new name
+            # at the same time first, instead of one by one while
+            # formatting
+            paths_with_fields = [
+                path
+                for name, path in zip(names, paths)
+                if meta_fields_get(name)
+            ]
+            if paths_with_fields:
+                meta_tags_dict = meta_tags_prefetch(paths_with_fields)
+                names = [
+                    rename_metadata_format_action(
+                        name, path, meta_tags_dict.get(path)
+                    )
+                    for name, path in zip(names, paths)
+                ]
+
+        return names
+
+
+class RenamePreview:
+    """
+    The new names of a selection, remembering the names after each stage.
+
+    While the selection stays the same, each new plan only reruns the
+    stages from the first one whose fields changed. The names going into
+    that stage are the same as last time, so changing the last fields
+    (like numbering) doesn't rerun the first ones (like from file).
+
+    Plans whose new names were already generated (going back to previous
+    fields) take them from rename_memo without running any stage.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forgets the remembered names"""
+        self._paths = None
+        # Old names, whether each item is a file, and names and extensions
+        # before any stage
+        self._old_names = []
+        self._is_files = []
+        self._names = []
+        self._exts = []
+        # [(stage name, stage key, names after the stage)] of the active
+        # stages of the last plan, in order
+        self._stage_columns = []
+        # (stage key, extensions after the stage) of the last plan
+        self._ext_column = None
+
+    def new_names_get(self, paths, plan, entries_info=None):
+        """
+        Returns the list of new names of the paths with the plan, in the
+        same order as paths. entries_info is the {path: EntryInfo} of the
+        file view, only paths that aren't there are stat'd
+        """
+        paths = tuple(paths)
+        idxs = range(len(paths))
+
+        if paths != self._paths:
+            self.clear()
+            self._paths = paths
+            self._old_names = list(map(os.path.basename, paths))
+            self._is_files = plan.is_files_get(paths, entries_info)
+            self._names, self._exts = plan.split_column(
+                self._old_names, self._is_files
+            )
+
+        # The whole column was already generated with the same fields
+        memo_keys = plan.memo_keys_get(
+            self._old_names, idxs, paths, self._is_files
+        )
+        new_names = rename_memo.lookup_many(plan.key, memo_keys)
+        if new_names is not None:
+            logging.debug("Preview reused all the new names from the memo")
+            return plan.meta_format_column(new_names, paths)
+
+        # Reuse the names of the stages at the start that didn't change
+        names = self._names
+        reused = 0
+        for stage_name, (cached_name, cached_key, cached_names) in zip(
+            plan.stage_names, self._stage_columns
+        ):
+            if (
+                stage_name != cached_name
+                or plan.stage_keys[stage_name] != cached_key
+            ):
+                break
+            names = cached_names
+            reused += 1
+
+        # And run the rest
+        del self._stage_columns[reused:]
+        for stage_name, stage in zip(
+            plan.stage_names[reused:], plan.stages[reused:]
+        ):
+            names = _stage_column_run(stage, names, idxs, paths)
+            self._stage_columns.append(
+                (stage_name, plan.stage_keys[stage_name], names)
+            )
+
+        logging.debug(f"Preview reused {reused} of {len(plan.stages)} stages")
+
+        # The extension only depends on its own stage
+        ext_key = plan.stage_keys["ext_replace"]
+        if self._ext_column is None or self._ext_column[0] != ext_key:
+            exts = self._exts
+            if plan.ext_stage is not None:
+                exts = _stage_column_run(plan.ext_stage, exts, idxs, paths)
+            self._ext_column = (ext_key, exts)
+
+        new_names = plan.join_column(names, self._ext_column[1])
+        rename_memo.put_many(plan.key, memo_keys, new_names)
+
+        return plan.meta_format_column(new_names, paths)
+
+
+def _stage_key_get(stage_name, fields_dict):
+    """
+    Returns what the result of a stage depends on: its fields (the ones
+    starting with its name) and, for the fields that are files, the
+    signature of the file
+    """
+    prefix = stage_name + "_"
+    stage_key = []
+    for field, value in fields_dict.items():
+        if not field.startswith(prefix):
+            continue
+        stage_key.append((field, value))
+
+        if field.endswith("_file") and value:
+            try:
+                stage_key.append(file_signature_get(value))
+            except OSError:
+                stage_key.append(None)
+
+    return tuple(stage_key)
+
+
+def _stage_column(column):
+    """Decorator that adds the column version to a stage function"""
+
+    def _decorator(stage):
+        stage.column = column
+        return stage
+
+    return _decorator
+
+
+def _stage_column_run(stage, names, idxs, paths):
+    """
+    Runs a stage over a column of names, when the stage has no column
+    version runs it name by name
+    """
+    column = getattr(stage, "column", None)
+    if column is not None:
+        return column(names, idxs, paths)
+
+    return list(map(stage, names, idxs, paths))
+
+
+def _stages_chain(*stages):
+    """
+    Joins several stages that run one after the other into one stage.
+    The stages that are None are left out, and when all are None returns
+    None
+    """
+    stages = [stage for stage in stages if stage is not None]
+
+    if not stages:
+        return None
+    elif len(stages) == 1:
+        return stages[0]
+
+    def _column(names, idxs, paths):
+        for stage in stages:
+            names = _stage_column_run(stage, names, idxs, paths)
+
+        return names
+
+    @_stage_column(_column)
+    def _stage(name, idx, path):
+        for stage in stages:
+            name = stage(name, idx, path)
+
+        return name
+
+    return _stage
+
+
+def _stage_run(stage, name, idx=0, path=""):
+    """Runs a compiled stage, when the stage is None returns the name"""
+    if stage is None:
+        return name
+
+    return stage(name, idx, path)
+
+
 """
-RENAME FIELD APPLY
+RENAME FIELD COMPILE & APPLY
+
+Each field has a compile function that returns the stage function (or None
+when the stage wouldn't change the name) and an action function that
+compiles and runs it for a single name.
 """
 
 
-def rename_from_file_action(name, idx, fields_dict):
+def rename_from_file_compile(fields_dict):
     """
     Get the file to extract the names from, open it and match the names
     one to one per index base
+
+    The file lines are shared between previews while the file doesn't
+    change, and each name is read only when needed
     """
     rename_from_file_file = fields_dict.get("rename_from_file_file")
     rename_from_file_wrap = fields_dict.get("rename_from_file_wrap")
 
-    # Handling of
-    if os.path.exists(rename_from_file_file):
+    if not rename_from_file_file:
+        return None
+
+    try:
+        lines = from_file_lines_get(rename_from_file_file)
+    except FileNotFoundError:
+        return None
+    except IsADirectoryError:
+        logging.warning(
+            f'rename_from_file_file: "{rename_from_file_file}" is a direct'
+            "ory"
+        )
+        return None
+
+    lines_count = len(lines)
+    # An empty file has no names to give
+    if not lines_count:
+        return None
+
+    def _stage(name, idx, path):
         try:
-            with open(rename_from_file_file, "r") as f:
-                lines = f.read().splitlines()
-                lines_count = len(lines)
-                try:
-                    if rename_from_file_wrap:
-                        name = lines[idx % lines_count]
-                    else:
-                        name = lines[idx]
-                except IndexError:
-                    pass
-        except IsADirectoryError:
-            logging.warning(
-                f'rename_from_file_file: "{rename_from_file_file}" is a direct'
-                "ory"
-            )
+            if rename_from_file_wrap:
+                name = lines[idx % lines_count]
+            else:
+                name = lines[idx]
+        except IndexError:
+            pass
 
-    return name
+        return name
 
+    return _stage
 
-def rename_reg_exp_action(name, fields_dict):
+
+def rename_from_file_action(name, idx, fields_dict):
+    """Renames one name from the file"""
+    return _stage_run(rename_from_file_compile(fields_dict), name, idx)
+
+
+def rename_reg_exp_compile(fields_dict):
     """
     Matches the regular expression specified in the match_reg entry
     and recreates the name with the words and number groups specified
@@ -157,109 +943,236 @@ def rename_reg_exp_action(name, fields_dict):
         replace_with: The /2 which are used to run the /1
 
         returns: The Files which are used to run the Program
+
+    Groups can also be used by name with "/<name>"
     """
     reg_exp_match_reg = fields_dict.get("reg_exp_match_reg")
     reg_exp_replace_with = fields_dict.get("reg_exp_replace_with")
 
     if not (reg_exp_match_reg and reg_exp_replace_with):
         # Exit soon when no regexes
-        return name
+        return None
 
     try:
-        reg_exp_match_reg = re.compile(reg_exp_match_reg)
+        reg_exp_rename = reg_exp_rename_get(
+            reg_exp_match_reg, reg_exp_replace_with
+        )
     # Handle unterminated patterns while writing
     except re.error:
-        pass
-    else:
-        reg_grouping = reg_exp_match_reg.match(name)
-        # Reassign name after we have done the regex matching first
-        name = reg_exp_replace_with
+        return None
 
-        # Prevent "AttributeError"
-        if reg_grouping is None:
-            return name
+    def _column(names, idxs, paths):
+        return reg_exp_rename.rename_column(names)
 
-        # Replace the numbered groups with the group match
-        for i in range(0, len(reg_grouping.groups()) + 1):
-            # Prevent IndexError blocking
-            try:
-                # "/i" gets replace for the ith match group
-                name = name.replace(f"/{i}", reg_grouping.group(i))
-            except IndexError:
-                pass
+    @_stage_column(_column)
+    def _stage(name, idx, path):
+        return reg_exp_rename.rename(name)
 
-    return name
+    return _stage
 
 
-def rename_name_basic_action(name, fields_dict):
+def rename_reg_exp_action(name, fields_dict):
+    """Regular expression rename for one name"""
+    return _stage_run(rename_reg_exp_compile(fields_dict), name)
+
+
+def rename_name_basic_compile(fields_dict):
     """Self explanatory"""
     name_basic_name_opt = fields_dict.get("name_basic_name_opt")
 
     if name_basic_name_opt == "Remove":
-        name = ""
+        return lambda name, idx, path: ""
     elif name_basic_name_opt == "Reverse":
-        name = name[::-1]
+        return lambda name, idx, path: name[::-1]
     elif name_basic_name_opt == "Fixed":
-        name = fields_dict.get("name_basic_fixed_name")
+        name_basic_fixed_name = fields_dict.get("name_basic_fixed_name")
+        return lambda name, idx, path: name_basic_fixed_name
 
-    return name
+    return None
 
 
-def rename_replace_action(name, fields_dict):
-    """Does the replace action for the new name"""
+def rename_name_basic_action(name, fields_dict):
+    """Self explanatory"""
+    return _stage_run(rename_name_basic_compile(fields_dict), name)
+
+
+def rename_replace_compile(fields_dict):
+    """
+    Does the replace action for the new name. First the replace pair and
+    then the replacement table
+    """
+    return _stages_chain(
+        _replace_pair_compile(fields_dict),
+        _replace_table_compile(fields_dict),
+    )
+
+
+def _replace_pair_compile(fields_dict):
+    """Replaces the one replace pair"""
     replace_replace_this = fields_dict.get("replace_replace_this")
     replace_replace_with = fields_dict.get("replace_replace_with")
     replace_match_case = fields_dict.get("replace_match_case")
 
     # When replacing with match case it's a simple matter
     if replace_match_case:
-        name = name.replace(replace_replace_this, replace_replace_with)
+        if replace_replace_this == replace_replace_with:
+            return None
+
+        replace = methodcaller(
+            "replace", replace_replace_this, replace_replace_with
+        )
+
+        def _column(names, idxs, paths):
+            return list(map(replace, names))
+
+        @_stage_column(_column)
+        def _stage(name, idx, path):
+            return replace(name)
+
+        return _stage
+
     # But when replacing without minding the case...
     # (If replace_replace_this is empty it breaks)
-    elif replace_replace_this:
-        # Start searching from the start of the string
-        idx = 0
-        # Find at what position what we want to replace is (all lowercase)
-        # If find returns a -1 it means it didn't find it and we can break
-        while (
-            idx := name.lower().find(replace_replace_this.lower(), idx)
-        ) != -1:
-            # Create the new name
-            name = (
-                name[:idx]
-                + replace_replace_with
-                + name[idx + len(replace_replace_this) :]
-            )
+    if not replace_replace_this:
+        return None
+
+    # The casefolded needle is the same for every name
+    replace_this_folded = replace_replace_this.casefold()
+    replace_this_len = len(replace_this_folded)
+
+    def _stage(name, idx, path):
+        # Search in the casefolded name, and map the positions back to the
+        # name to know what to replace
+        folded, positions = casefold_with_positions(name)
+
+        # Build the new name by pieces and join them once at the end
+        pieces = []
+        last = 0
+        start = 0
+        while (found := folded.find(replace_this_folded, start)) != -1:
+            end = found + replace_this_len
+            # A match must start and end at whole chars of the name (a char
+            # can casefold to several chars, ex: "ß" to "ss")
+            if (found == 0 or positions[found - 1] != positions[found]) and (
+                positions[end - 1] != positions[end]
+            ):
+                pieces.append(name[last : positions[found]])
+                pieces.append(replace_replace_with)
+                last = positions[end]
+                start = end
+            else:
+                start = found + 1
 
-            # New index from where to search
-            idx = idx + len(replace_replace_with)
+        # Nothing to replace
+        if not pieces:
+            return name
 
-    return name
+        pieces.append(name[last:])
+        return "".join(pieces)
 
+    return _stage
 
-def rename_case_change_action(name, fields_dict):
+
+def _replace_table_compile(fields_dict):
+    """
+    Replaces all the replace pairs in the replacement table file in one
+    go. The table is reused between previews while the file doesn't change
+    """
+    replace_table_file = fields_dict.get("replace_table_file")
+    replace_match_case = fields_dict.get("replace_match_case")
+
+    if not replace_table_file:
+        return None
+
+    try:
+        replace_table = replace_table_get(
+            replace_table_file, bool(replace_match_case)
+        )
+    except FileNotFoundError:
+        return None
+    except IsADirectoryError:
+        logging.warning(
+            f'replace_table_file: "{replace_table_file}" is a directory'
+        )
+        return None
+
+    if not replace_table:
+        return None
+
+    return lambda name, idx, path: replace_table.replace(name)
+
+
+def rename_replace_action(name, fields_dict):
+    """Does the replace action for the new name"""
+    return _stage_run(rename_replace_compile(fields_dict), name)
+
+
+def rename_case_change_compile(fields_dict):
     """Does the case change for the new name"""
     case_case_want = fields_dict.get("case_case_want")
 
-    if case_case_want == "Upper Case":
-        name = name.upper()
+    case_function = {
+        "Upper Case": str.upper,
+        "Lower Case": str.lower,
+        "Title": str.title,
+        "Sentence": str.capitalize,
+    }.get(case_case_want)
 
-    elif case_case_want == "Lower Case":
-        name = name.lower()
+    if case_function is None:
+        return None
 
-    elif case_case_want == "Title":
-        name = name.title()
+    def _column(names, idxs, paths):
+        return list(map(case_function, names))
 
-    elif case_case_want == "Sentence":
-        name = name.capitalize()
+    @_stage_column(_column)
+    def _stage(name, idx, path):
+        return case_function(name)
 
-    return name
+    return _stage
 
 
-def rename_remove_action(name, fields_dict):
-    """Main remove function. It's been broken down into simpler parts"""
+def rename_case_change_action(name, fields_dict):
+    """Does the case change for the new name"""
+    return _stage_run(rename_case_change_compile(fields_dict), name)
+
+
+class _TranslateTable(dict):
+    """
+    Translation table for str.translate that works out what each char is
+    translated to the first time it's seen, with char_function(char)
+    """
+
+    def __init__(self, char_function):
+        self.char_function = char_function
+
+    def __missing__(self, codepoint):
+        chars = self[codepoint] = self.char_function(chr(codepoint))
+        return chars
+
+
+def _accents_fold(char):
+    """Replaces the accents of a char for its no accented counterpart"""
+    # Decompose the char and drop the accents (the combining chars)
+    return "".join(
+        [
+            c
+            for c in unicodedata.normalize("NFKD", char)
+            if not unicodedata.combining(c)
+        ]
+    )
 
-    def _remove_n_chars(name):
+
+# Chars without their accents, shared by every remove stage
+_accents_fold_table = _TranslateTable(_accents_fold)
+
+
+def rename_remove_compile(fields_dict):
+    """
+    Main remove function. It's been broken down into simpler parts, only
+    the parts that would remove something are kept
+    """
+
+    def _remove_n_chars():
         """Removes chars depending on their index"""
         remove_first_n = fields_dict.get("remove_first_n")
         # Need this to be a negative number
@@ -268,18 +1181,25 @@ def rename_remove_action(name, fields_dict):
         remove_from_n = fields_dict.get("remove_from_n") - 1
         remove_to_n = fields_dict.get("remove_to_n")
 
-        name = name[remove_first_n:]
-        # Only act when the index is not 0
-        if remove_last_n != 0:
-            name = name[:remove_last_n]
-        # Only act when the index is not -1
-        if remove_from_n != -1:
-            # Doing it with str slices is faster than transforming it to a list
-            name = name[:remove_from_n] + name[remove_to_n:]
+        if not remove_first_n and remove_last_n == 0 and remove_from_n == -1:
+            return None
+
+        def _part(name):
+            name = name[remove_first_n:]
+            # Only act when the index is not 0
+            if remove_last_n != 0:
+                name = name[:remove_last_n]
+            # Only act when the index is not -1
+            if remove_from_n != -1:
+                # Doing it with str slices is faster than transforming it
+                # to a list
+                name = name[:remove_from_n] + name[remove_to_n:]
 
-        return name
+            return name
+
+        return _part
 
-    def _remove_words_chars(name):
+    def _remove_words_chars():
         """
         Firstly removes the apparition of a word (must be between spaces).
         Secondly removes every apparition of any of the chars that were
@@ -288,30 +1208,41 @@ def rename_remove_action(name, fields_dict):
         remove_rm_words = fields_dict.get("remove_rm_words")
         remove_rm_chars = fields_dict.get("remove_rm_chars")
 
-        # Only try this if theres somethin in remove_rm_words, otherwise it
-        # would have to transform the string into lists and loop through the
-        # whole name of each selected item everytime
-        if remove_rm_words:
-            # Create list of words to remove, splitted spaces
-            remove_rm_words = remove_rm_words.split()
-            # Create a list out of the name string, splitted spaces
-            name_list = name.split()
-
-            # Use list comprehension to loop trough the name (as a list) and
-            # create an output list with the words that are Not inside the
-            # remove_rm_words list, then join the list into a str with
-            # spaces inbetween
-            name = " ".join(
-                [word for word in name_list if word not in remove_rm_words]
-            )
+        if not (remove_rm_words or remove_rm_chars):
+            return None
 
-        # Removes every apparition of all chars in the str by themselves
-        for chara in remove_rm_chars:
-            name = name.replace(chara, "")
+        # Only try this if theres somethin in remove_rm_words, otherwise
+        # it would have to transform the string into lists and loop
+        # through the whole name of each selected item everytime
+        words_active = bool(remove_rm_words)
+        # Create set of words to remove, splitted spaces
+        remove_rm_words = set(remove_rm_words.split())
+        # Translation table that deletes all the chars in one go
+        rm_chars_table = str.maketrans("", "", remove_rm_chars)
+
+        def _part(name):
+            if words_active:
+                # Use list comprehension to loop trough the name (as a list
+                # splitted at spaces) and create an output list with the
+                # words that are Not inside the remove_rm_words set, then
+                # join the list into a str with spaces inbetween
+                name = " ".join(
+                    [
+                        word
+                        for word in name.split()
+                        if word not in remove_rm_words
+                    ]
+                )
 
-        return name
+            # Removes every apparition of all chars in the str by themselves
+            if remove_rm_chars:
+                name = name.translate(rm_chars_table)
+
+            return name
+
+        return _part
 
-    def _crop_remove(name):
+    def _crop_remove():
         """
         Crops before or after the specified char(s).
         It can also crop inbetween 2 char(s), ex:
@@ -322,24 +1253,34 @@ def rename_remove_action(name, fields_dict):
         remove_crop_this = fields_dict.get("remove_crop_this")
 
         # If this field is empty do nothing
-        if remove_crop_this:
-            # If the combobox is not in 'Special' do the regular crops
-            if remove_crop_pos != "Special":
+        if not remove_crop_this:
+            return None
+
+        # If the combobox is not in 'Special' do the regular crops
+        if remove_crop_pos != "Special":
+
+            def _part(name):
                 name_tuple = name.partition(remove_crop_this)
                 # Dont crop if it would be the only thing left
                 if remove_crop_pos == "Before" and name_tuple[2]:
                     name = name_tuple[2]
                 elif remove_crop_pos == "After" and name_tuple[0]:
                     name = name_tuple[0]
-            else:
-                # Create a regular expresion from the given string
-                reg_exp = remove_crop_this.replace("*", ".+?", 1)
-                reg_exp = re.compile(reg_exp)
-                name = re.sub(reg_exp, "", name)
 
-        return name
+                return name
+
+            return _part
+
+        # Create a regular expresion from the given string
+        try:
+            reg_exp = re.compile(remove_crop_this.replace("*", ".+?", 1))
+        # Handle unterminated patterns while writing
+        except re.error:
+            return None
+
+        return lambda name: reg_exp.sub("", name)
 
-    def _remove_checkbuttons(name):
+    def _remove_checkbuttons():
         """Checks what checkbuttons are active and removes accordingly"""
         remove_digits = fields_dict.get("remove_digits")
         remove_d_s = fields_dict.get("remove_d_s")
@@ -347,46 +1288,114 @@ def rename_remove_action(name, fields_dict):
         remove_chars = fields_dict.get("remove_chars")
         remove_sym = fields_dict.get("remove_sym")
 
-        if remove_digits:
-            for char in string.digits:
-                name = name.replace(char, "")
-        # Remove double spaces for single space
-        if remove_d_s:
+        if not (
+            remove_digits
+            or remove_d_s
+            or remove_accents
+            or remove_chars
+            or remove_sym
+        ):
+            return None
+
+        # Digits are removed from the name as it is, letters and symbols
+        # after replacing the accents
+        pre_delete = string.digits if remove_digits else ""
+        post_delete = (string.ascii_letters if remove_chars else "") + (
+            string.punctuation if remove_sym else ""
+        )
+
+        def _delete_table_get(pre_delete, post_delete):
+            """Translation table that does all the removing char by char"""
+            if not remove_accents:
+                return str.maketrans("", "", pre_delete + post_delete)
+
+            post_delete_table = str.maketrans("", "", post_delete)
+
+            def _char_remove(char):
+                if char in pre_delete:
+                    return ""
+                return char.translate(_accents_fold_table).translate(
+                    post_delete_table
+                )
+
+            return _TranslateTable(_char_remove)
+
+        if not remove_d_s:
+            # Every option works char by char, so they all go into one
+            # translation table
+            delete_table = _delete_table_get(pre_delete, post_delete)
+            return lambda name: name.translate(delete_table)
+
+        # Removing double spaces has to happen after the digits and before
+        # the rest. The translations that wouldn't remove anything are left
+        # out, by default only the double spaces are removed
+        if not pre_delete and not post_delete and not remove_accents:
+            return lambda name: name.replace("  ", " ")
+
+        pre_delete_table = str.maketrans("", "", pre_delete)
+        delete_table = _delete_table_get("", post_delete)
+
+        def _part(name):
+            if pre_delete:
+                name = name.translate(pre_delete_table)
+            # Remove double spaces for single space
             name = name.replace("  ", " ")
-        # Replace accents for their no accented counterpart
-        if remove_accents:
-            # Not sure how this thing works (from stackoverflow)
-            nfkd_form = unicodedata.normalize("NFKD", name)
-            name = "".join(
-                [c for c in nfkd_form if not unicodedata.combining(c)]
-            )
-        if remove_chars:
-            for char in string.ascii_letters:
-                name = name.replace(char, "")
-        if remove_sym:
-            for char in string.punctuation:
-                name = name.replace(char, "")
+            if post_delete or remove_accents:
+                name = name.translate(delete_table)
+            return name
 
-        return name
+        return _part
 
-    def _lead_dots(name):
+    def _lead_dots():
         """Removes either '.' or '..' right at the begining"""
         remove_lead_dots = fields_dict.get("remove_lead_dots")
-        if remove_lead_dots != "None" and name.startswith(remove_lead_dots):
-            name = name.replace(remove_lead_dots, "", 1)
+
+        if remove_lead_dots == "None":
+            return None
+
+        def _part(name):
+            if name.startswith(remove_lead_dots):
+                name = name.replace(remove_lead_dots, "", 1)
+
+            return name
+
+        return _part
+
+    parts = [
+        part
+        for part in (
+            _remove_n_chars(),
+            _remove_words_chars(),
+            _crop_remove(),
+            _remove_checkbuttons(),
+            _lead_dots(),
+        )
+        if part is not None
+    ]
+
+    if not parts:
+        return None
+
+    # The usual case, just one part
+    if len(parts) == 1:
+        (part,) = parts
+        return lambda name, idx, path: part(name)
+
+    def _stage(name, idx, path):
+        for part in parts:
+            name = part(name)
 
         return name
 
-    name = _remove_n_chars(name)
-    name = _remove_words_chars(name)
-    name = _crop_remove(name)
-    name = _remove_checkbuttons(name)
-    name = _lead_dots(name)
+    return _stage
 
-    return name
 
+def rename_remove_action(name, fields_dict):
+    """Main remove function"""
+    return _stage_run(rename_remove_compile(fields_dict), name)
 
-def rename_move_copy_text_action(name, fields_dict):
+
+def rename_move_copy_text_compile(fields_dict):
     """
     Copies and pastes the selected characters to the selected
     position.
@@ -399,42 +1408,66 @@ def rename_move_copy_text_action(name, fields_dict):
 
     if move_parts_ori_pos == "Start":
         if move_parts_end_pos == "End":
-            name = (
-                name[move_parts_ori_n:]
-                + move_parts_sep
-                + name[:move_parts_ori_n]
-            )
+
+            def _stage(name, idx, path):
+                return (
+                    name[move_parts_ori_n:]
+                    + move_parts_sep
+                    + name[:move_parts_ori_n]
+                )
+
+            return _stage
 
         elif move_parts_end_pos == "Position":
-            name = (
-                name[move_parts_ori_n:move_parts_end_n]
-                + move_parts_sep
-                + name[:move_parts_ori_n]
-                + move_parts_sep
-                + name[move_parts_end_n:]
-            )
+
+            def _stage(name, idx, path):
+                return (
+                    name[move_parts_ori_n:move_parts_end_n]
+                    + move_parts_sep
+                    + name[:move_parts_ori_n]
+                    + move_parts_sep
+                    + name[move_parts_end_n:]
+                )
+
+            return _stage
 
     elif move_parts_ori_pos == "End":
         if move_parts_end_pos == "Start":
-            name = (
-                name[-move_parts_ori_n:]
-                + move_parts_sep
-                + name[:-move_parts_ori_n]
-            )
+
+            def _stage(name, idx, path):
+                return (
+                    name[-move_parts_ori_n:]
+                    + move_parts_sep
+                    + name[:-move_parts_ori_n]
+                )
+
+            return _stage
 
         elif move_parts_end_pos == "Position":
-            name = (
-                name[:move_parts_end_n]
-                + move_parts_sep
-                + name[-move_parts_ori_n:]
-                + move_parts_sep
-                + name[move_parts_end_n:-move_parts_ori_n]
-            )
 
-    return name
+            def _stage(name, idx, path):
+                return (
+                    name[:move_parts_end_n]
+                    + move_parts_sep
+                    + name[-move_parts_ori_n:]
+                    + move_parts_sep
+                    + name[move_parts_end_n:-move_parts_ori_n]
+                )
 
+            return _stage
 
-def rename_add_action(name, fields_dict):
+    return None
+
+
+def rename_move_copy_text_action(name, fields_dict):
+    """
+    Copies and pastes the selected characters to the selected
+    position.
+    """
+    return _stage_run(rename_move_copy_text_compile(fields_dict), name)
+
+
+def rename_add_compile(fields_dict):
     """
     Adds the char(s) to the specified position.
     Also can add spaces before capital letters.
@@ -445,48 +1478,91 @@ def rename_add_action(name, fields_dict):
     add_to_str_suffix = fields_dict.get("add_to_str_suffix")
     add_to_str_word_space = fields_dict.get("add_to_str_word_space")
 
-    # Add prefix
-    name = add_to_str_prefix + name
-
-    # If blocks to determine where to write the sub str
-    # To be able to do it seamlessly it needs different ways to act
-    # depending on the position
-    if add_to_str_at_pos == 0:
-        name = add_to_str_insert_this + name
-    elif add_to_str_at_pos == -1 or add_to_str_at_pos >= len(name):
-        name = name + add_to_str_insert_this
-    elif add_to_str_at_pos > 0:
-        name = (
-            name[:add_to_str_at_pos]
-            + add_to_str_insert_this
-            + name[add_to_str_at_pos:]
-        )
-    elif add_to_str_at_pos < -1:
-        add_to_str_at_pos += 1
-        name = (
-            name[:add_to_str_at_pos]
-            + add_to_str_insert_this
-            + name[add_to_str_at_pos:]
-        )
+    if not (
+        add_to_str_prefix
+        or add_to_str_insert_this
+        or add_to_str_suffix
+        or add_to_str_word_space
+    ):
+        return None
 
-    # Add suffix
-    name = name + add_to_str_suffix
+    # When only adding at the start and the end the whole thing is just a
+    # concatenation, which can be done for the whole column at once
+    if not add_to_str_word_space and (
+        not add_to_str_insert_this or add_to_str_at_pos in (0, -1)
+    ):
+        lead = add_to_str_prefix
+        trail = add_to_str_suffix
+        if add_to_str_at_pos == 0:
+            lead = add_to_str_insert_this + lead
+        else:
+            trail = add_to_str_insert_this + trail
 
-    if add_to_str_word_space:
-        # Add a space before each capital letter
-        name = "".join([" " + ch if ch.isupper() else ch for ch in name])
+        def _column(names, idxs, paths):
+            return [lead + name + trail for name in names]
 
-    return name
+        @_stage_column(_column)
+        def _stage(name, idx, path):
+            return lead + name + trail
 
+        return _stage
 
-def rename_add_folder_rename_action(name, path, fields_dict):
+    def _stage(name, idx, path):
+        # Add prefix
+        name = add_to_str_prefix + name
+
+        # If blocks to determine where to write the sub str
+        # To be able to do it seamlessly it needs different ways to act
+        # depending on the position
+        if add_to_str_at_pos == 0:
+            name = add_to_str_insert_this + name
+        elif add_to_str_at_pos == -1 or add_to_str_at_pos >= len(name):
+            name = name + add_to_str_insert_this
+        elif add_to_str_at_pos > 0:
+            name = (
+                name[:add_to_str_at_pos]
+                + add_to_str_insert_this
+                + name[add_to_str_at_pos:]
+            )
+        elif add_to_str_at_pos < -1:
+            name = (
+                name[: add_to_str_at_pos + 1]
+                + add_to_str_insert_this
+                + name[add_to_str_at_pos + 1 :]
+            )
+
+        # Add suffix
+        name = name + add_to_str_suffix
+
+        if add_to_str_word_space:
+            # Add a space before each capital letter
+            name = "".join([" " + ch if ch.isupper() else ch for ch in name])
+
+        return name
+
+    return _stage
+
+
+def rename_add_action(name, fields_dict):
+    """
+    Adds the char(s) to the specified position.
+    Also can add spaces before capital letters.
+    """
+    return _stage_run(rename_add_compile(fields_dict), name)
+
+
+def rename_add_folder_rename_compile(fields_dict):
     """Adds parent directories at position: start, end, position"""
     add_folder_name_name_pos = fields_dict.get("add_folder_name_name_pos")
     add_folder_name_sep = fields_dict.get("add_folder_name_sep")
     add_folder_name_levels = fields_dict.get("add_folder_name_levels")
+    add_folder_name_pos = fields_dict.get("add_folder_name_pos")
 
     # Active when the level is at least 1
-    if add_folder_name_levels > 0:
+    if add_folder_name_levels <= 0:
+        return None
+
+    def _stage(name, idx, path):
         # Split the directory into a list with each folder
         folders = path.split("/")
         # Initilize the full folder name
@@ -508,7 +1584,6 @@ def rename_add_folder_rename_action(name, path, fields_dict):
             if add_folder_name_sep:
                 name = name[: -len(add_folder_name_sep)]
         elif add_folder_name_name_pos == "Position":
-            add_folder_name_pos = fields_dict.get("add_folder_name_pos")
             # If blocks to determine where to write the sub str
             # To be able to do it seamlessly it needs different ways to act
             # depending on the position
@@ -527,65 +1602,101 @@ def rename_add_folder_rename_action(name, path, fields_dict):
                     + name[add_folder_name_pos:]
                 )
             elif add_folder_name_pos < -1:
-                add_folder_name_pos += 1
                 name = (
-                    name[:add_folder_name_pos]
+                    name[: add_folder_name_pos + 1]
                     + add_folder_name_sep
                     + folder_full
-                    + name[add_folder_name_pos:]
+                    + name[add_folder_name_pos + 1 :]
                 )
 
-    return name
+        return name
 
+    return _stage
 
-def rename_numbering_action(name, idx, fields_dict):
-    """Calls to create the numbering and then sets it up inplace"""
 
-    def _numbering_create(n, base, padding):
-        """
-        Creates the final numbering to add as a str
+def rename_add_folder_rename_action(name, path, fields_dict):
+    """Adds parent directories at position: start, end, position"""
+    return _stage_run(
+        rename_add_folder_rename_compile(fields_dict), name, path=path
+    )
 
-        Changes the number to the the chosen base, removes the part of the
-        string that specifies that its a number in such a base and then
-        adds the padding 0s.
-        For the letter cases transforms the number to what letter it would
-        correspond and adds the padding As
-        """
-        padding_char = "0"
-        # Number cases
-        if base == "Base 10":
-            n = str(n)
-        elif base == "Base 2":
-            n = bin(n)
-            n = n[2:]
-        elif base == "Base 8":
-            n = oct(n)
-            n = n[2:]
-        elif base == "Base 16":
-            n = hex(n)
-            n = n[2:]
-
-        # Letter cases
-        else:
-            # Uses a cycle variable to know how many times it has to loop
-            # ex: 1 -> A, 27 -> AA, 53 -> BA
-            cycle = n // 26
-            letter_n = ""
-            for a in range(0, cycle + 1):
-                letter_n = letter_n + string.ascii_lowercase[n - 26 * cycle]
 
-            padding_char = "a"
-            n = letter_n
+def _numbering_create(n, base, padding):
+    """
+    Creates the final numbering to add as a str
+
+    Changes the number to the the chosen base, removes the part of the
+    string that specifies that its a number in such a base and then
+    adds the padding 0s.
+    For the letter cases transforms the number to what letter it would
+    correspond and adds the padding As
+    """
+    padding_char = "0"
+    # Number cases
+    if base == "Base 10":
+        n = str(n)
+    elif base == "Base 2":
+        n = bin(n)
+        n = n[2:]
+    elif base == "Base 8":
+        n = oct(n)
+        n = n[2:]
+    elif base == "Base 16":
+        n = hex(n)
+        n = n[2:]
+
+    # Letter cases
+    else:
+        # Uses a cycle variable to know how many times it has to loop
+        # ex: 1 -> A, 27 -> AA, 53 -> BA
+        cycle = n // 26
+        letter_n = ""
+        for a in range(0, cycle + 1):
+            letter_n = letter_n + string.ascii_lowercase[n - 26 * cycle]
+
+        padding_char = "a"
+        n = letter_n
+
+        if base == "Upper Case Letters":
+            padding_char = "A"
+            n = n.upper()
 
-            if base == "Upper Case Letters":
-                padding_char = "A"
-                n = n.upper()
+    # Add right padding
+    n = n.rjust(padding, padding_char)
+
+    return n
+
+
+def _numbering_create_column(ns, base, padding):
+    """
+    Creates the numbering strings for a whole column of numbers
+
+    The number bases are formatted and padded in one map over the whole
+    column, the letter cases (and negative numbers, whose str has the
+    sign) go number by number through _numbering_create
+    """
+    format_code = {
+        "Base 10": "d",
+        "Base 2": "b",
+        "Base 8": "o",
+        "Base 16": "x",
+    }.get(base)
+
+    if format_code is None or (ns and min(ns) < 0):
+        return [_numbering_create(n, base, padding) for n in ns]
+
+    # Pad with 0s to the right, ex: "%03x" formats 10 as "00a"
+    # (printf style formatting is the fastest but has no binary format)
+    if format_code == "b":
+        number_format = f"{{:0>{padding}b}}".format
+    else:
+        number_format = f"%0{padding}{format_code}".__mod__
 
-        # Add right padding
-        n = n.rjust(padding, padding_char)
+    return list(map(number_format, ns))
 
-        return n
 
+def rename_numbering_compile(fields_dict):
+    """Calls to create the numbering and then sets it up inplace"""
     numbering_mode = fields_dict.get("numbering_mode")
     numbering_at_n = fields_dict.get("numbering_at_n")
     numbering_start_num = fields_dict.get("numbering_start_num")
@@ -594,90 +1705,186 @@ def rename_numbering_action(name, idx, fields_dict):
     numbering_type_base = fields_dict.get("numbering_type_base")
     numbering_pad = fields_dict.get("numbering_pad")
 
-    # Calculate what number we are in taking into account the step and
-    # the starting number
-    n = idx + numbering_start_num + (numbering_incr_num - 1) * idx
-    # Change the number to string in whatever base
-    n = _numbering_create(n, numbering_type_base, numbering_pad)
-
-    if numbering_mode == "Prefix":
-        name = n + numbering_sep + name
-    elif numbering_mode == "Suffix":
-        name = name + numbering_sep + n
-    elif numbering_mode == "Both":
-        name = n + numbering_sep + name + numbering_sep + n
-    elif numbering_mode == "Position":
-        # If blocks to determine where to write the separators and how to
-        # act depending on where we have to write it to make it seem
-        # seamless
-        if numbering_at_n == 0:
+    if numbering_mode not in ("Prefix", "Suffix", "Both", "Position"):
+        return None
+
+    def _place(name, n):
+        """Sets the number string in place"""
+        if numbering_mode == "Prefix":
             name = n + numbering_sep + name
-        elif numbering_at_n == -1 or numbering_at_n >= len(name):
+        elif numbering_mode == "Suffix":
             name = name + numbering_sep + n
-        elif numbering_at_n > 0:
-            name = (
-                name[:numbering_at_n]
-                + numbering_sep
-                + n
-                + numbering_sep
-                + name[numbering_at_n:]
-            )
-        elif numbering_at_n < -1:
-            numbering_at_n += 1
-            name = (
-                name[:numbering_at_n]
-                + numbering_sep
-                + n
-                + numbering_sep
-                + name[numbering_at_n:]
+        elif numbering_mode == "Both":
+            name = n + numbering_sep + name + numbering_sep + n
+        elif numbering_mode == "Position":
+            # If blocks to determine where to write the separators and how to
+            # act depending on where we have to write it to make it seem
+            # seamless
+            if numbering_at_n == 0:
+                name = n + numbering_sep + name
+            elif numbering_at_n == -1 or numbering_at_n >= len(name):
+                name = name + numbering_sep + n
+            elif numbering_at_n > 0:
+                name = (
+                    name[:numbering_at_n]
+                    + numbering_sep
+                    + n
+                    + numbering_sep
+                    + name[numbering_at_n:]
+                )
+            elif numbering_at_n < -1:
+                name = (
+                    name[: numbering_at_n + 1]
+                    + numbering_sep
+                    + n
+                    + numbering_sep
+                    + name[numbering_at_n + 1 :]
+                )
+
+        return name
+
+    def _column(names, idxs, paths):
+        # Same as in the stage: idx + start + (incr - 1) * idx
+        step = numbering_incr_num * getattr(idxs, "step", 0)
+        if isinstance(idxs, range) and step:
+            ns = range(
+                numbering_start_num + numbering_incr_num * idxs.start,
+                numbering_start_num + numbering_incr_num * idxs.stop,
+                step,
             )
+        else:
+            ns = [numbering_start_num + numbering_incr_num * i for i in idxs]
+        numbers = _numbering_create_column(
+            ns, numbering_type_base, numbering_pad
+        )
 
-    return name
+        # Joining with the separator is the same as concatenating each part
+        # with the separator inbetween
+        if numbering_mode == "Prefix":
+            return list(map(numbering_sep.join, zip(numbers, names)))
+        elif numbering_mode == "Suffix":
+            return list(map(numbering_sep.join, zip(names, numbers)))
+        elif numbering_mode == "Both":
+            return list(map(numbering_sep.join, zip(numbers, names, numbers)))
 
+        return list(map(_place, names, numbers))
 
-def rename_ext_action(ext, fields_dict):
+    @_stage_column(_column)
+    def _stage(name, idx, path):
+        # Calculate what number we are in taking into account the step and
+        # the starting number
+        n = idx + numbering_start_num + (numbering_incr_num - 1) * idx
+        # Change the number to string in whatever base
+        n = _numbering_create(n, numbering_type_base, numbering_pad)
+
+        return _place(name, n)
+
+    return _stage
+
+
+def rename_numbering_action(name, idx, fields_dict):
+    """Calls to create the numbering and then sets it up inplace"""
+    return _stage_run(rename_numbering_compile(fields_dict), name, idx)
+
+
+def rename_ext_compile(fields_dict):
     """Extension renaming"""
     ext_replace_change_ext = fields_dict.get("ext_replace_change_ext")
     ext_replace_fixed_ext = fields_dict.get("ext_replace_fixed_ext")
 
     if ext_replace_change_ext == "Lower":
-        ext = ext.lower()
+        ext_function = str.lower
     elif ext_replace_change_ext == "Upper":
-        ext = ext.upper()
+        ext_function = str.upper
     elif ext_replace_change_ext == "Title":
-        ext = ext.title()
+        ext_function = str.title
     elif ext_replace_change_ext == "Extra":
-        ext = ext + "." + ext_replace_fixed_ext
+        extra_ext = "." + ext_replace_fixed_ext
+        ext_function = lambda ext: ext + extra_ext
     elif ext_replace_change_ext == "Fixed":
-        ext = "." + ext_replace_fixed_ext
+        fixed_ext = "." + ext_replace_fixed_ext
+        ext_function = lambda ext: fixed_ext
     elif ext_replace_change_ext == "Remove":
-        ext = ""
+        ext_function = lambda ext: ""
+    else:
+        return None
+
+    def _column(exts, idxs, paths):
+        return list(map(ext_function, exts))
+
+    @_stage_column(_column)
+    def _stage(ext, idx, path):
+        return ext_function(ext)
+
+    return _stage
+
+
+def rename_ext_action(ext, fields_dict):
+    """Extension renaming"""
+    return _stage_run(rename_ext_compile(fields_dict), ext)
+
+
+# Compile function for each name stage in bpn_data.RENAME_ORDER
+RENAME_STAGE_COMPILERS = {
+    "rename_from_file": rename_from_file_compile,
+    "reg_exp": rename_reg_exp_compile,
+    "name_basic": rename_name_basic_compile,
+    "replace": rename_replace_compile,
+    "case": rename_case_change_compile,
+    "remove": rename_remove_compile,
+    "move": rename_move_copy_text_compile,
+    "add_to_str": rename_add_compile,
+    "add_folder_name": rename_add_folder_rename_compile,
+    "numbering": rename_numbering_compile,
+    "ext_replace": rename_ext_compile,
+}
+
+# Separators of the folders in a new name
+_NEW_NAME_SEPARATORS_RE = re.compile(
+    "|".join(re.escape(sep) for sep in (os.sep, os.altsep) if sep)
+)
+
+# Max number of folders renamed at the same time
+RENAME_MAX_WORKERS = 8
+
+# Stages whose result depends on the index of the item in the selection
+RENAME_STAGES_USING_IDX = frozenset(("rename_from_file", "numbering"))
+# Stages whose result depends on the path of the item
+RENAME_STAGES_USING_PATH = frozenset(("add_folder_name",))
+
+# Max number of generated new names remembered
+RENAME_MEMO_SIZE = 100_000
+# Generated new names, shared by every RenamePlan and grouped by its
+# fields (RenamePlan.key). The hits and misses attributes count how many
+# names were reused and generated
+rename_memo = MemoCache(RENAME_MEMO_SIZE)
+
+
+def rename_metadata_format_action(name, path, meta_tags=None):
+    """
+    Format the string with the values from the metadata dictionary.
+
+    meta_tags are the tags of the file when they were already read (see
+    meta_tags_prefetch), otherwise they are read here
+    """
+    # Only load the metadata if the string contains fields like {artist}
+    if META_FIELD_RE.search(name) is None:
+        return name
+
+    if meta_tags is None:
+        meta_tags = meta_tags_get(path)
+
+    # If the past function returned something (it was a valid file)
+    if meta_tags:
+
+        def _field_replace(match):
+            # Only the first value of the tag (the metadata is a dict of
+            # lists). Fields of tags the file doesn't have are left as is
+            values = meta_tags.get(match[1])
+            return values[0] if values else match[0]
 
-    return ext
-
-
-def rename_metadata_format_action(name, path):
-    """Format the string with the values from the metadata dictionary"""
-    # Only load the metadata if the string contains '{' and '}'
-    if ("{" and "}") in name:
-        meta_audio = meta_audio_get(path)
-
-        # If the past function returned something (it was a valid file)
-        if meta_audio:
-            # Get a dict that's the same as meta_audio but only the first
-            # item of each key (because the metadata is a dict of lists)
-            metadata = {item: meta_audio[item][0] for item in meta_audio}
-            # Get a list of the keys in the dict adding the string between
-            # curly braces
-            field_list = ["{" + key + "}" for key in metadata.keys()]
-
-            # Individually check and replace for each possible key in the dict
-            # (need to do this because if you want to use curly braces in the
-            # string it would raise an error and would skip any actual editing)
-            for field in field_list:
-                # **variable unpacks a dictionary into keyword arguments
-                # eg: ['a':1, 'b':2] unpacks into function(a=1, b=2)
-                # (also *variable unpack a list/tuple into position arguments)
-                name = name.replace(field, field.format(**metadata))
+        # Replace all the fields in one pass, any other curly braces in
+        # the string are left as they are
+        name = META_FIELD_RE.sub(_field_replace, name)
 
     return name
@@ -0,0 +1,208 @@
+import collections
+import logging
+
+from batchpynamer.data.cache_data_tools import FileCache
+
+# Number of replacement tables kept loaded at the same time
+REPLACE_TABLE_CACHE_SIZE = 4
+# What separates the text to replace from what to replace it with
+REPLACE_TABLE_SEP = "\t"
+
+
+class ReplaceTable:
+    """
+    Many replace pairs applied all at once.
+
+    The table file has a replace pair per line: what to replace and what
+    to replace it with, separated by a tab. Lines without a tab remove the
+    text, empty lines are skipped. When the same text is in the table more
+    than once the first pair is used.
+
+    All the texts to replace are built into an Aho-Corasick automaton, so
+    each name is read left to right only once, no matter how many pairs
+    there are. When matches overlap the one that starts first wins, and
+    between matches that start at the same position the longest.
+
+    Without match case the texts are compared casefolded.
+    """
+
+    def __init__(self, path, match_case=True):
+        self.path = path
+        self.match_case = match_case
+
+        # Trie nodes: the transitions from each node, the length of the text
+        # that leads to it, and the replacement when that text is a whole
+        # text to replace (None if not)
+        self._goto = [{}]
+        self._depth = [0]
+        self._replace_with = [None]
+
+        with open(path, "r", errors="replace") as f:
+            for line in f.read().splitlines():
+                replace_this, _, replace_with = line.partition(
+                    REPLACE_TABLE_SEP
+                )
+                if replace_this:
+                    self._insert(replace_this, replace_with)
+
+        self._build_links()
+
+        logging.debug(
+            f'Loaded replacement table from "{path}" with '
+            f"{len(self._goto)} nodes"
+        )
+
+    def _insert(self, replace_this, replace_with):
+        """Adds a text to replace to the trie"""
+        if not self.match_case:
+            replace_this = replace_this.casefold()
+
+        node = 0
+        for char in replace_this:
+            try:
+                node = self._goto[node][char]
+            except KeyError:
+                self._goto.append({})
+                self._depth.append(self._depth[node] + 1)
+                self._replace_with.append(None)
+                self._goto[node][char] = len(self._goto) - 1
+                node = len(self._goto) - 1
+
+        # The first pair for a text wins
+        if self._replace_with[node] is None:
+            self._replace_with[node] = replace_with
+
+    def _build_links(self):
+        """
+        Creates the failure links (the node of the longest suffix of a
+        node that is also in the trie) and the output links (the node of
+        the longest suffix that is a whole text to replace), going through
+        the trie breadth first
+        """
+        self._fail = [0] * len(self._goto)
+        self._output = [
+            node if replace_with is not None else 0
+            for node, replace_with in enumerate(self._replace_with)
+        ]
+
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+
+                if self._replace_with[child] is None:
+                    self._output[child] = self._output[fail]
+
+    def __bool__(self):
+        """An empty table doesn't replace anything"""
+        return len(self._goto) > 1
+
+    def replace(self, name):
+        """Replaces every text in the table found in the name"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        depth = self._depth
+
+        if self.match_case:
+            text = name
+            positions = range(len(name) + 1)
+        else:
+            text, positions = casefold_with_positions(name)
+
+        def _aligned(start, end):
+            """Checks the match starts and ends at whole chars of the name"""
+            return (
+                start == 0 or positions[start - 1] != positions[start]
+            ) and (positions[end - 1] != positions[end])
+
+        pieces = []
+        # Where the name hasn't been copied yet (in text positions)
+        last = 0
+        # The leftmost (then longest) match found and not replaced yet
+        best_start = best_end = best_node = None
+
+        node = 0
+        i = 0
+        text_len = len(text)
+        while i < text_len or best_start is not None:
+            if i < text_len:
+                char = text[i]
+                while node and char not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(char, 0)
+                i += 1
+
+                # Texts to replace that end here, from the longest one
+                out = output[node]
+                while out:
+                    start = i - depth[out]
+                    if (
+                        best_start is None or start <= best_start
+                    ) and _aligned(start, i):
+                        best_start, best_end, best_node = start, i, out
+                        break
+                    out = output[fail[out]]
+
+                # Keep going while something being matched could start
+                # before (or at) the best match
+                if best_start is None or i - depth[node] <= best_start:
+                    continue
+
+            # The best match is the final one (or the name ended): replace
+            # it and start again after it
+            pieces.append(name[positions[last] : positions[best_start]])
+            pieces.append(self._replace_with[best_node])
+            last = i = best_end
+            best_start = None
+            node = 0
+
+        # Nothing to replace
+        if not pieces:
+            return name
+
+        pieces.append(name[positions[last] :])
+        return "".join(pieces)
+
+
+def casefold_with_positions(name):
+    """
+    Returns the casefolded name and, for each of its chars, the position
+    of the char of the name it comes from (plus the length of the name at
+    the end). For ascii names the positions are the same, so a range is
+    enough
+    """
+    if name.isascii():
+        return name.lower(), range(len(name) + 1)
+
+    folded_chars = []
+    positions = []
+    for i, char in enumerate(name):
+        folded_char = char.casefold()
+        folded_chars.append(folded_char)
+        positions.extend([i] * len(folded_char))
+    positions.append(len(name))
+
+    return "".join(folded_chars), positions
+
+
+# Loaded replacement tables, reused while the file doesn't change
+_replace_table_cache = FileCache(ReplaceTable, REPLACE_TABLE_CACHE_SIZE)
+
+
+def replace_table_get(path, match_case=True):
+    """
+    Returns the ReplaceTable for the path, reusing the already built one
+    while the file hasn't changed (same modification time and size).
+
+    Raises FileNotFoundError when the path doesn't exist and
+    IsADirectoryError when it's a directory.
+    """
+    return _replace_table_cache.get(path, match_case)
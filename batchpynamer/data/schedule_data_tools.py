@@ -0,0 +1,96 @@
+import itertools
+import logging
+import os
+
+# Start of the temporary names used to break rename cycles
+TEMP_NAME_PREFIX = ".bpn_tmp_"
+
+
+def rename_schedule_get(renames):
+    """
+    Orders the renames so each new path is free by the time it's used.
+    renames is a list of (old_path, new_path) pairs, the pairs where both
+    are the same are left out.
+
+    When the new path of a rename is the old path of another one (a->b,
+    b->c) the other one has to be done first, so the renames form chains
+    that are done from the end (b->c, a->b). When a chain closes on
+    itself (a->b, b->a) one of its items is first moved to a temporary
+    name and moved to its new path at the end (a->tmp, b->a, tmp->b).
+    Chains take one rename per item and cycles one more, the fewest
+    possible.
+
+    Apart from that the renames keep their order, so items that don't
+    depend on each other are renamed in the same order as given.
+
+    Returns the list of (old_path, new_path) in the order to rename them,
+    including the temporary renames.
+    """
+    renames = [(old, new) for old, new in renames if old != new]
+    # {old path: new path}
+    new_paths = dict(renames)
+
+    scheduled = set()
+    schedule = []
+    # Names that can't be used as temporary names, only needed when there
+    # are cycles
+    taken_names = None
+
+    for old_path, new_path in renames:
+        if old_path in scheduled:
+            continue
+
+        # Follow the chain of renames that have to be done before this one
+        chain = [old_path]
+        chain_set = {old_path}
+        cycle = False
+        next_path = new_path
+        while next_path in new_paths and next_path not in scheduled:
+            if next_path == old_path:
+                cycle = True
+                break
+            # Two items with the same new path: the chain can't go on
+            if next_path in chain_set:
+                break
+            chain.append(next_path)
+            chain_set.add(next_path)
+            next_path = new_paths[next_path]
+
+        scheduled.update(chain)
+
+        if cycle:
+            if taken_names is None:
+                taken_names = {
+                    os.path.basename(path)
+                    for path in itertools.chain(
+                        new_paths.keys(), new_paths.values()
+                    )
+                }
+            # Free the start of the cycle with a temporary name
+            temp_path = _temp_path_get(os.path.dirname(old_path), taken_names)
+            schedule.append((old_path, temp_path))
+            for path in reversed(chain[1:]):
+                schedule.append((path, new_paths[path]))
+            schedule.append((temp_path, new_path))
+            logging.debug(
+                f"Rename cycle of {len(chain)} items broken with "
+                f'"{temp_path}"'
+            )
+        else:
+            for path in reversed(chain):
+                schedule.append((path, new_paths[path]))
+
+    return schedule
+
+
+def _temp_path_get(directory, taken_names):
+    """
+    Returns a path inside the directory with a temporary name that isn't
+    in taken_names and doesn't exist, and adds the name to taken_names
+    """
+    for n in itertools.count():
+        temp_name = f"{TEMP_NAME_PREFIX}{n}"
+        temp_path = os.path.join(directory, temp_name)
+        if temp_name not in taken_names and not os.path.lexists(temp_path):
+            taken_names.add(temp_name)
+            return temp_path
@@ -0,0 +1,280 @@
+import collections
+import ctypes
+import errno
+import logging
+import os
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Not available in Windows, where folders can't be synced anyway
+_O_DIRECTORY = getattr(os, "O_DIRECTORY", 0)
+
+# Share of the open files limit (RLIMIT_NOFILE) that the folders of a
+# batch can take, the rest is left for the copies and everything else
+DIR_FDS_LIMIT_SHARE = 4
+# Max folders open at the same time when the limit can't be read or has
+# none
+DIR_FDS_MAX_DEFAULT = 256
+
+# renameat2 constants (from linux/fcntl.h and linux/fs.h)
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+
+def _renameat2_load():
+    """
+    Returns the renameat2 function of the C library, or None when it isn't
+    available (not Linux or glibc older than 2.28)
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        logging.debug("renameat2 not available, using rename")
+        return None
+
+    renameat2.argtypes = (
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    )
+    renameat2.restype = ctypes.c_int
+    return renameat2
+
+
+_renameat2 = _renameat2_load()
+
+
+def rename_noreplace(old_path, new_path, src_dir_fd=None, dst_dir_fd=None):
+    """
+    Renames old_path to new_path without ever overwriting new_path.
+
+    On Linux it's a single renameat2 call with RENAME_NOREPLACE, so
+    checking and renaming are one atomic operation. When it isn't
+    available (or the file system doesn't support the flag) it checks if
+    new_path exists and then renames.
+
+    The paths are relative to src_dir_fd and dst_dir_fd when given, like
+    in os.rename.
+
+    Raises FileExistsError when new_path exists, and OSError for any other
+    error of the rename.
+    """
+    if _renameat2 is not None:
+        result = _renameat2(
+            AT_FDCWD if src_dir_fd is None else src_dir_fd,
+            os.fsencode(old_path),
+            AT_FDCWD if dst_dir_fd is None else dst_dir_fd,
+            os.fsencode(new_path),
+            RENAME_NOREPLACE,
+        )
+        if result == 0:
+            return
+
+        error = ctypes.get_errno()
+        # Only fall back when the flag isn't supported (kernels older than
+        # 3.15 and some file systems)
+        if error not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(error, os.strerror(error), old_path, None, new_path)
+
+    try:
+        os.stat(new_path, dir_fd=dst_dir_fd, follow_symlinks=False)
+    except FileNotFoundError:
+        pass
+    else:
+        raise FileExistsError(
+            errno.EEXIST, os.strerror(errno.EEXIST), old_path, None, new_path
+        )
+
+    os.rename(old_path, new_path, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+
+
+def dir_fds_max_get():
+    """
+    Returns how many folders a DirFds can keep open, a share of the open
+    files limit of the process
+    """
+    if resource is None:
+        return DIR_FDS_MAX_DEFAULT
+
+    try:
+        soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (OSError, ValueError):
+        return DIR_FDS_MAX_DEFAULT
+
+    if soft_limit == resource.RLIM_INFINITY:
+        return DIR_FDS_MAX_DEFAULT
+    # At least the two folders of a rename
+    return max(2, soft_limit // DIR_FDS_LIMIT_SHARE)
+
+
+class DirFds:
+    """
+    File descriptors of folders, each folder opened only once.
+
+    Renaming relative to the folder (with just the names) saves the kernel
+    from resolving the whole path twice per rename. And as the folders are
+    opened before renaming anything, renaming a folder in the middle of a
+    batch doesn't break the renames of the items inside it.
+
+    At most max_fds folders are open at the same time (by default a share
+    of the open files limit, see dir_fds_max_get). When the folders given
+    don't fit they aren't opened before starting: each one is opened when
+    needed, closing the least recently used one, and all_opened is False
+    so the batch keeps its order. A folder that can't be opened (too many
+    open files too) is used by its whole path.
+
+    When sync the folders closed to make room are synced to the disk
+    first, as their paths may have changed by the time the batch syncs
+    them (see fsync).
+
+    Use it as a context manager so the folders get closed.
+    """
+
+    def __init__(self, directories=(), max_fds=None, sync=False):
+        self.max_fds = dir_fds_max_get() if max_fds is None else max_fds
+        self.sync = sync
+        # Folders synced when they were closed, and not opened again
+        self._synced = set()
+        # {folder: fd}, None when the folder couldn't be opened. Least
+        # recently used first
+        self._fds = collections.OrderedDict()
+        self._num_open = 0
+        # The folders can be used from many threads
+        self._lock = threading.Lock()
+
+        directories = dict.fromkeys(directories)
+        # Only when they all fit they are kept open, the fds can't be
+        # closed then as other threads may be using them
+        self._keep_open = len(directories) <= self.max_fds
+        for directory in directories if self._keep_open else ():
+            self.get(directory)
+
+    def get(self, directory):
+        """
+        Returns the file descriptor of the folder, or None when it can't
+        be opened (the paths have to be used whole then)
+        """
+        with self._lock:
+            try:
+                fd = self._fds[directory]
+            except KeyError:
+                pass
+            else:
+                self._fds.move_to_end(directory)
+                return fd
+
+            if self._num_open >= self.max_fds:
+                # Every folder kept open is in use
+                if self._keep_open:
+                    return None
+                self._least_recent_close()
+
+            self._synced.discard(directory)
+            fd = None
+            if os.rename in os.supports_dir_fd:
+                try:
+                    fd = os.open(
+                        directory,
+                        os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC,
+                    )
+                except OSError as error:
+                    logging.debug(
+                        f'Couldn\'t open folder "{directory}": {error}'
+                    )
+                else:
+                    self._num_open += 1
+
+            self._fds[directory] = fd
+            return fd
+
+    def _least_recent_close(self):
+        """Closes the least recently used folder to make room"""
+        while self._fds:
+            directory, fd = self._fds.popitem(last=False)
+            if fd is not None:
+                if self.sync:
+                    self._fsync(directory, fd)
+                    self._synced.add(directory)
+                os.close(fd)
+                self._num_open -= 1
+                return
+
+    def fsync(self, directory):
+        """
+        Syncs the folder to the disk, so the renames done in it survive a
+        crash or a power loss. Uses its fd when it's open, otherwise the
+        folder is opened just for it (unless it was synced when closed)
+        """
+        with self._lock:
+            fd = self._fds.get(directory)
+            if fd is None and directory in self._synced:
+                return
+        if fd is not None:
+            self._fsync(directory, fd)
+            return
+
+        try:
+            fd = os.open(directory, os.O_RDONLY | _O_DIRECTORY)
+        except OSError as error:
+            logging.warning(f'Couldn\'t sync folder "{directory}": {error}')
+            return
+        try:
+            self._fsync(directory, fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _fsync(directory, fd):
+        try:
+            os.fsync(fd)
+        # Not every system can sync folders (like Windows)
+        except OSError as error:
+            logging.warning(f'Couldn\'t sync folder "{directory}": {error}')
+
+    def all_opened(self):
+        """Whether every folder could be opened and is kept open"""
+        return self._keep_open and None not in self._fds.values()
+
+    def close(self):
+        """Closes all the folders"""
+        for fd in self._fds.values():
+            if fd is not None:
+                os.close(fd)
+        self._fds.clear()
+        self._synced.clear()
+        self._num_open = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def rename_noreplace_at(old_path, new_path, dir_fds):
+    """
+    Same as rename_noreplace but relative to the folders of the paths,
+    taken from dir_fds (a DirFds)
+    """
+    old_dir, old_name = os.path.split(old_path)
+    new_dir, new_name = os.path.split(new_path)
+    src_dir_fd = dir_fds.get(old_dir)
+    dst_dir_fd = dir_fds.get(new_dir)
+
+    # Use the whole paths when a folder couldn't be opened
+    if src_dir_fd is None or dst_dir_fd is None:
+        rename_noreplace(old_path, new_path)
+    else:
+        rename_noreplace(
+            old_name, new_name, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd
+        )
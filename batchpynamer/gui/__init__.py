@@ -19,6 +19,8 @@ def tk_init_post_hook():
     other widgets without caring for widget creation order
     """
 
+    import batchpynamer.config as bpn_config
+    from batchpynamer.data.history_data_tools import RenameHistory
     from batchpynamer.gui.infobar import Info_Bar
     from batchpynamer.gui.menubar import TopMenu
     from batchpynamer.gui.notebook.metadata.a_text import MetadataListEntries
@@ -37,15 +39,14 @@ def tk_init_post_hook():
     )
     from batchpynamer.gui.notebook.rename.j_numbering import Numbering
     from batchpynamer.gui.notebook.rename.k_ext_replace import ExtReplace
-    from batchpynamer.gui.notebook.rename.rename import LastRename
     from batchpynamer.gui.trees.a_directory_navigator import DirectoryNavigator
     from batchpynamer.gui.trees.b_file_navigator import FileNavigator
     from batchpynamer.gui.trees.c_directory_entry import DirectoryEntryFrame
     from batchpynamer.gui.trees.filtering import FiltersWidget
 
-    # Last Rename Object
-    global last_rename
-    last_rename = LastRename()
+    # Rename History Object
+    global rename_history
+    rename_history = RenameHistory(bpn_config.rename_history_file)
 
     # Main Window Widgets
     global info_bar
@@ -1,9 +1,10 @@
 import logging
+import os
 from tkinter import ttk
 
 import batchpynamer.config as bpn_config
 import batchpynamer.gui as bpn_gui
-from batchpynamer.data.rename_data_tools import rename_create_new_name_action
+from batchpynamer.data.rename_data_tools import RenamePlan
 from batchpynamer.gui import infobar
 from batchpynamer.gui.basewidgets import (
     BaseFieldsWidget,
@@ -168,39 +169,81 @@ def command_gui_apply_command_call(event=None):
         logging.info("GUI- command- " + inf_msg)
 
 
+def command_gui_rename_plans_get(command_name=None):
+    """
+    Compiles a command and the chain of commands that follow it into a
+    list of RenamePlan, one for each step
+    """
+    plans = []
+    while command_name and command_name != "DEFAULT":
+        # Get the variables values dict from the config command file under
+        # the command name
+        fields_dict = bpn_config.command_conf.command_conf_fields_get(
+            command_name
+        )
+        plans.append(RenamePlan(fields_dict))
+        # Follow the chain with the next_step
+        command_name = fields_dict["next_step"]
+
+    return plans
+
+
 def command_gui_generate_name_action(
-    command_name=None, old_name="", old_path="", idx=0
+    command_name=None,
+    old_name="",
+    old_path="",
+    idx=0,
+    plans=None,
+    entries_info=None,
 ):
     """
     Directly applies a command or a chain of commands.
+
+    When renaming many items pass the plans already compiled with
+    command_gui_rename_plans_get so the commands are only read once, and
+    the entries_info of the file view so the items aren't stat'd.
     """
+    if plans is None:
+        # Gets the selected command if a command_name wasn't provided
+        if command_name is None or command_name == "DEFAULT":
+            return ""
+        plans = command_gui_rename_plans_get(command_name)
 
-    # Gets the selected command if a command_name wasn't provided
-    if command_name is None or command_name == "DEFAULT":
-        return ""
-
-    # Get the variables values dict from the config command file under
-    # the selected command name
-    fields_dict = bpn_config.command_conf.command_conf_fields_get(command_name)
-
-    new_name = rename_create_new_name_action(
-        old_name, idx, old_path, fields_dict
-    )
-
-    # Get the next_step call recursevely
-    next_step = fields_dict["next_step"]
-    if next_step:
-        # Call command_gui_apply_action with next_step
-        new_name = command_gui_generate_name_action(
-            command_name=next_step,
-            old_name=new_name,
-            old_path=old_path,
-            idx=idx,
-        )
+    new_name = old_name
+    # Each step of the chain gets the name from the previous one
+    for plan in plans:
+        new_name = plan.apply(new_name, idx, old_path, entries_info)
 
     return new_name
 
 
+def command_gui_generate_names_action(
+    command_name=None, old_paths=(), plans=None, entries_info=None
+):
+    """
+    Directly applies a command or a chain of commands to many items at
+    once. Returns the list of new names, in the same order as old_paths.
+
+    Each command goes over all the names before the next one starts, so
+    the time limits of its stages (like the regular expression one) are
+    for the whole selection instead of for each name.
+    """
+    old_paths = list(old_paths)
+    if plans is None:
+        # Gets the selected command if a command_name wasn't provided
+        if command_name is None or command_name == "DEFAULT":
+            return [""] * len(old_paths)
+        plans = command_gui_rename_plans_get(command_name)
+
+    new_names = [os.path.basename(old_path) for old_path in old_paths]
+    idxs = range(len(old_paths))
+    # Each step of the chain gets the names from the previous one
+    for plan in plans:
+        new_names = plan.apply_column(new_names, idxs, old_paths, entries_info)
+
+    return new_names
+
+
 def command_gui_delete_command_action():
     """Deletes selected command from the command configuration file"""
     # Get selected command
@@ -45,6 +45,9 @@ class WindowRoot(tk.Tk):
         # Initialize the global key bindings
         self.root_binds()
 
+        # Offer to recover a rename batch that was interrupted last time
+        rename.rename_gui_journal_recover_check()
+
         self.mainloop()
 
     def root_binds(self):
@@ -86,6 +89,7 @@ class WindowRoot(tk.Tk):
         self.bind("<Control-R>", rename.rename_gui_apply_rename_call)
         self.bind("<Control-z>", rename.rename_gui_undo_rename_call)
         self.bind("<Control-Z>", rename.rename_gui_undo_rename_call)
+        self.bind("<Control-Shift-Z>", rename.rename_gui_redo_rename_call)
 
     def rename_unbinds(self):
         # Entries Reset
@@ -97,3 +101,4 @@ class WindowRoot(tk.Tk):
         self.unbind("<Control-R>")
         self.unbind("<Control-z>")
         self.unbind("<Control-Z>")
+        self.unbind("<Control-Shift-Z>")
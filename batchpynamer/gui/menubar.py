@@ -4,6 +4,7 @@ import webbrowser  # for the About menu
 import batchpynamer as bpn
 import batchpynamer.config as bpn_config
 import batchpynamer.gui as bpn_gui
+from batchpynamer.data.conflict_data_tools import COLLISION_SUFFIX_FORMATS
 from batchpynamer.gui import commands
 from batchpynamer.gui.notebook.metadata import metadata
 from batchpynamer.gui.notebook.rename import rename
@@ -14,6 +15,13 @@ from batchpynamer.plugins import plugins_base
 class TopMenu(tk.Menu):
     def __init__(self):
         self.rename_order_bottom_to_top = tk.BooleanVar(value=False)
+        self.rename_transactional = tk.BooleanVar(value=False)
+        self.rename_durable = tk.BooleanVar(value=False)
+        self.rename_into_folders = tk.BooleanVar(value=False)
+        self.rename_collisions_resolve = tk.BooleanVar(value=False)
+        self.rename_collision_suffix = tk.StringVar(
+            value=COLLISION_SUFFIX_FORMATS[0]
+        )
 
     def tk_init(self, master):
         super().__init__(master, bg="gray75", foreground="black")
@@ -61,6 +69,13 @@ class TopMenu(tk.Menu):
             accelerator="Ctrl+Z",
         )
 
+        # Redo Rename
+        self.file_menu.add_command(
+            label="Redo Rename",
+            command=rename.rename_gui_redo_rename_call,
+            accelerator="Ctrl+Shift+Z",
+        )
+
         # Reset Entry Fields
         self.file_menu.add_command(
             label="Reset Entry Fields",
@@ -74,6 +89,47 @@ class TopMenu(tk.Menu):
             variable=self.rename_order_bottom_to_top,
         )
 
+        # All or nothing Rename
+        self.file_menu.add_checkbutton(
+            label="Roll back the whole rename if any item fails",
+            variable=self.rename_transactional,
+        )
+
+        # Durable Rename
+        self.file_menu.add_checkbutton(
+            label="Sync renames to the disk (survive power loss)",
+            variable=self.rename_durable,
+        )
+
+        # Rename into Folders
+        self.file_menu.add_checkbutton(
+            label="Allow folders in the new names (move into them)",
+            variable=self.rename_into_folders,
+            command=lambda: bpn_gui.fn_treeview.show_new_name(),
+        )
+
+        # Resolve Collisions
+        self.file_menu.add_checkbutton(
+            label="Add a counter to the new names that collide",
+            variable=self.rename_collisions_resolve,
+            command=lambda: bpn_gui.fn_treeview.show_new_name(),
+        )
+
+        # Collision Suffix Format
+        self.collision_suffix_menu = tk.Menu(
+            self.file_menu, tearoff=0, bg="gray75", foreground="black"
+        )
+        for suffix_format in COLLISION_SUFFIX_FORMATS:
+            self.collision_suffix_menu.add_radiobutton(
+                label=suffix_format.format(name="name", n=2, ext=".ext"),
+                value=suffix_format,
+                variable=self.rename_collision_suffix,
+                command=lambda: bpn_gui.fn_treeview.show_new_name(),
+            )
+        self.file_menu.add_cascade(
+            label="Collision Counter Format", menu=self.collision_suffix_menu
+        )
+
         # Separator
         self.file_menu.add_separator()
 
@@ -137,26 +193,28 @@ class TopMenu(tk.Menu):
         self.file_menu.entryconfigure(index=0, state="active")
         self.file_menu.entryconfigure(index=1, state="active")
         self.file_menu.entryconfigure(index=2, state="active")
+        self.file_menu.entryconfigure(index=3, state="active")
 
     def menu_opts_rename_disable(self):
         """Disable the rename menu options when not in the rename page"""
         self.file_menu.entryconfigure(index=0, state="disable")
         self.file_menu.entryconfigure(index=1, state="disable")
         self.file_menu.entryconfigure(index=2, state="disable")
+        self.file_menu.entryconfigure(index=3, state="disable")
 
     def menu_opts_metadata_enable(self):
         """Enable the metadata menu options when on the metadata page"""
         if bpn.METADATA_IMPORT:
-            self.file_menu.entryconfigure(index=5, state="active")
-            self.file_menu.entryconfigure(index=6, state="active")
-            self.file_menu.entryconfigure(index=7, state="active")
+            self.file_menu.entryconfigure(index=11, state="active")
+            self.file_menu.entryconfigure(index=12, state="active")
+            self.file_menu.entryconfigure(index=13, state="active")
 
     def menu_opts_metadata_disable(self):
         """Disable the metadata menu options when not in the metadata page"""
         if bpn.METADATA_IMPORT:
-            self.file_menu.entryconfigure(index=5, state="disable")
-            self.file_menu.entryconfigure(index=6, state="disable")
-            self.file_menu.entryconfigure(index=7, state="disable")
+            self.file_menu.entryconfigure(index=11, state="disable")
+            self.file_menu.entryconfigure(index=12, state="disable")
+            self.file_menu.entryconfigure(index=13, state="disable")
 
     def selection_menu_init(self):
         """Selection Menu Dropdown"""
@@ -129,7 +129,7 @@ class MetadataListEntries(BaseFieldsWidget, ttk.Frame):
         self.metadata_fields_reset()
         try:
             for file in selection:
-                meta_audio = metadata_data_tools.meta_audio_get(file)
+                meta_audio = metadata_data_tools.meta_tags_get(file)
 
                 for meta_item in meta_audio:
                     meta_value = meta_audio.get(meta_item)
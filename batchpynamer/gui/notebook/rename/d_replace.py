@@ -1,5 +1,6 @@
 from tkinter import ttk
 
+import batchpynamer.gui as bpn_gui
 from batchpynamer.gui.basewidgets import (
     BaseNamingWidget,
     BpnBoolVar,
@@ -13,6 +14,9 @@ class Replace(BaseNamingWidget, ttk.LabelFrame):  # (3)
     It has:
         - Entry to choose char(s) to replace
         - Entry for what to replace those char(s) with
+        - Checkbutton to match case
+        - Entry for the path to a replacement table file, with a replace
+        pair per line (what to replace, a tab, what to replace it with)
         - Reset button
     """
 
@@ -21,6 +25,7 @@ class Replace(BaseNamingWidget, ttk.LabelFrame):  # (3)
             replace_replace_this=BpnStrVar(""),
             replace_replace_with=BpnStrVar(""),
             replace_match_case=BpnBoolVar(False),
+            replace_table_file=BpnStrVar(""),
         )
 
     def tk_init(self, master):
@@ -58,4 +63,31 @@ class Replace(BaseNamingWidget, ttk.LabelFrame):  # (3)
         )
         self.match_case_check.grid(column=0, row=2)
 
+        # Replacement table file, entry
+        ttk.Label(self, text="Table").grid(column=0, row=3, sticky="w")
+        self.table_file_entry = ttk.Entry(
+            self,
+            width=10,
+            textvariable=self.fields.replace_table_file,
+        )
+        self.table_file_entry.grid(column=1, row=3, sticky="ew")
+
         self.bindings()
+
+    def bindings(self):
+        """
+        Redefine bindings to not refresh with every key stroke when writing to
+        replace_table_file
+        """
+        for field in self.fields.__dict__:
+            if field != "replace_table_file":
+                self.fields.__dict__[field].trace_add(
+                    "write", bpn_gui.fn_treeview.show_new_name
+                )
+
+        self.table_file_entry.bind(
+            "<FocusOut>", bpn_gui.fn_treeview.show_new_name
+        )
+        self.table_file_entry.bind(
+            "<Return>", bpn_gui.fn_treeview.show_new_name
+        )
@@ -1,58 +1,39 @@
 import logging
 import os
-from tkinter import ttk
+from tkinter import filedialog, ttk
 
 import batchpynamer.config as bpn_config
 import batchpynamer.gui as bpn_gui
-from batchpynamer.data.rename_data_tools import rename_system_rename
+from batchpynamer.data.conflict_data_tools import (
+    rename_collisions_resolve,
+    rename_conflicts_get,
+)
+from batchpynamer.data.error_report_data_tools import RenameErrorReport
+from batchpynamer.data.history_data_tools import (
+    RenameBatch,
+    history_schedule_get,
+)
+from batchpynamer.data.journal_data_tools import (
+    RenameJournal,
+    journal_batch_get,
+    journal_recover,
+    journal_remove,
+)
+from batchpynamer.data.rename_data_tools import (
+    RENAME_NOT_DONE,
+    RENAME_ROLLED_BACK,
+    rename_new_dirs_make,
+    rename_new_dirs_remove,
+    rename_new_path_get,
+    rename_system_rename,
+    rename_system_rename_batch,
+)
+from batchpynamer.data.reg_exp_data_tools import RegExpTimeoutError
+from batchpynamer.data.schedule_data_tools import rename_schedule_get
 from batchpynamer.gui import basewidgets, commands, infobar
 from batchpynamer.gui.trees import trees
 
 
-class LastRename:
-    """
-    A last rename object that saves the previous renames and
-    gives the ability to undo the changes
-
-    A list of tuples where tuple[0] is the old name and
-    tuple[1] the new name
-    """
-
-    def __init__(self):
-        self.last_rename_list = []
-
-    def pair_append(self, old_path, new_path):
-        """Appending new items"""
-        pair_tuple = (old_path, new_path)
-        self.last_rename_list.append(pair_tuple)
-
-        return pair_tuple
-
-    def get(self):
-        """Return the last rename array"""
-        return self.last_rename_list
-
-    def last_name_list_get(self):
-        """Return the old name in the last rename"""
-        last_name_list = list(
-            last_name[0] for last_name in self.last_rename_list
-        )
-        return last_name_list
-
-    def new_name_list_get(self):
-        """Return the selected new name in the last rename"""
-        new_name_list = list(new_name[1] for new_name in self.last_rename_list)
-        return new_name_list
-
-    def clear(self):
-        """Clear the last rename array"""
-        self.last_rename_list = []
-
-    def __str__(self):
-        """Define how to print the object"""
-        return str(self.last_rename_list)
-
-
 class Rename(basewidgets.BaseWidget, ttk.Frame):
     """
     Draws the Rename button. Inside rename notebook. This is always last.
@@ -103,43 +84,63 @@ class Rename(basewidgets.BaseWidget, ttk.Frame):
 
 
 def rename_gui_undo_rename_call(event=None):
-    """Undo the last name changes.
-
-    You can only undo 1 step back.
-    """
-    # Get a copy of the last changes list so when it gets modified it
-    # doesnt affect this one and gets stuck in an infinite loop changing
-    # back and forth
-    # Undo the changes starting with the last one and going up
-    last_rename_list = reversed(bpn_gui.last_rename.get())
+    """Undo the last rename batch not undone yet"""
+    batch = bpn_gui.rename_history.undo_pop()
 
     # Try to undo the changes only if there are changes to undo
-    if last_rename_list:
-        # Show that it's in the process
-        infobar.show_working()
-
-        logging.info("Undo:")
-        for name_pair in last_rename_list:
-            # Get the new path and the old path from the last
-            # changes paths pairs
-            new_path = name_pair[1]
-            last_path = name_pair[0]
+    if batch is not None:
+        rename_gui_history_replay(batch, undo=True)
 
-            # Apply a system rename
-            rename_system_rename(new_path, last_path)
-        logging.info("-" * 20)
+    # Else show msg
+    else:
+        bpn_gui.info_bar.last_action_set("No Changes to Undo")
 
-        # Update the folders treeviews
-        trees.refresh_treeviews()
 
-        infobar.finish_show_working(inf_msg="Finished Undo Operation")
+def rename_gui_redo_rename_call(event=None):
+    """Redo the last rename batch undone"""
+    batch = bpn_gui.rename_history.redo_pop()
 
-        # Clear the last rename list pairs
-        bpn_gui.last_rename.clear()
+    # Try to redo the changes only if there are changes to redo
+    if batch is not None:
+        rename_gui_history_replay(batch, undo=False)
 
     # Else show msg
     else:
-        bpn_gui.info_bar.last_action_set("No Changes to Undo")
+        bpn_gui.info_bar.last_action_set("No Changes to Redo")
+
+
+def rename_gui_history_replay(batch, undo):
+    """
+    Undoes or redoes a rename batch from the history. The items that were
+    changed or moved since (the inode at the path isn't the same) are
+    skipped
+    """
+    action = "Undo" if undo else "Redo"
+    # Show that it's in the process
+    infobar.show_working()
+
+    logging.info(f"{action}:")
+    schedule, inodes = history_schedule_get(batch, undo=undo)
+    results = rename_system_rename_batch(
+        schedule,
+        rename_gui_journal_get(),
+        inodes,
+        durable=bpn_gui.menu_bar.rename_durable.get(),
+    )
+    logging.info("-" * 20)
+
+    # Update the folders treeviews
+    trees.refresh_treeviews()
+
+    report = RenameErrorReport(results)
+    if report:
+        RenameErrorReportWindow(
+            report,
+            f"{len(report)} of {len(results)} renames couldn't be "
+            f"{'undone' if undo else 'redone'}",
+        )
+
+    infobar.finish_show_working(inf_msg=f"Finished {action} Operation")
 
 
 def rename_gui_apply_rename_call(event=None):
@@ -160,38 +161,123 @@ def rename_gui_apply_rename_action(command_rename=None):
 
     # Try to apply the changes only if there is a selection
     if selection:
-        # Clear the last_rename action list
-        bpn_gui.last_rename.clear()
         # Show that its in the process
         infobar.show_working()
 
-        logging.info("Rename:")
-        for idx, old_path in enumerate(selection):
-            directory = os.path.dirname(old_path)
-            old_name = os.path.basename(old_path)
-            if command_rename:
-                new_name = commands.command_gui_generate_name_action(
+        # Generate the new names of the whole selection at once with the
+        # command chain, or get them from the file view
+        if command_rename:
+            try:
+                new_names = commands.command_gui_generate_names_action(
                     command_name=command_rename,
-                    old_name=old_name,
-                    old_path=old_path,
-                    idx=idx,
+                    old_paths=selection,
+                    entries_info=bpn_gui.fn_treeview.entries_info,
                 )
+            except RegExpTimeoutError as error:
+                new_names_error = str(error)
             else:
-                # Get new name from file view
-                new_name = bpn_gui.fn_treeview.new_name_get(old_path)
+                new_names_error = None
+        else:
+            new_names = map(bpn_gui.fn_treeview.new_name_get, selection)
+            new_names_error = bpn_gui.fn_treeview.new_names_error
+
+        # Never rename with names missing a stage
+        if new_names_error is not None:
+            logging.error(f"Rename failed: {new_names_error}")
+            infobar.finish_show_working(
+                inf_msg=f"Rename Failed: {new_names_error}"
+            )
+            return
+
+        # Generate all the new paths before renaming anything
+        into_folders = bpn_gui.menu_bar.rename_into_folders.get()
+        renames = []
+        for old_path, new_name in zip(selection, new_names):
             # Create new path
-            new_path = os.path.join(directory, new_name)
+            renames.append(
+                (
+                    old_path,
+                    rename_new_path_get(old_path, new_name, into_folders),
+                )
+            )
+
+        # Add a counter to the new names that collide. The names from the
+        # file view are already resolved, so they stay the same
+        if bpn_gui.menu_bar.rename_collisions_resolve.get():
+            renames = rename_collisions_resolve(
+                renames, bpn_gui.menu_bar.rename_collision_suffix.get()
+            )
+
+        # Check every rename for conflicts at once, so nothing is renamed
+        # when any of them would fail
+        conflicts = rename_conflicts_get(renames)
+        if conflicts:
+            rename_gui_conflicts_show(conflicts)
+            return
+
+        # Create all the folders the items go into before moving them
+        new_dirs = []
+        if into_folders:
+            dir_errors = rename_new_dirs_make(
+                renames, bpn_gui.menu_bar.rename_durable.get(), new_dirs
+            )
+            if dir_errors:
+                rename_new_dirs_remove(new_dirs)
+                RenameErrorReportWindow(
+                    RenameErrorReport(dir_errors),
+                    f"{len(dir_errors)} folders couldn't be created, nothing "
+                    "was renamed",
+                )
+                infobar.finish_show_working(inf_msg="Rename Failed")
+                return
+
+        # Order the renames so chains and cycles of names (like swapping
+        # two names) don't run into each other
+        schedule = rename_schedule_get(renames)
 
-            # Rename and handle output
-            result = rename_system_rename(old_path, new_path)
+        logging.info("Rename:")
+        transactional = bpn_gui.menu_bar.rename_transactional.get()
+        results = rename_system_rename_batch(
+            schedule,
+            rename_gui_journal_get(),
+            transactional=transactional,
+            durable=bpn_gui.menu_bar.rename_durable.get(),
+            new_dirs=new_dirs,
+        )
+        # Save the renames done to be able to undo them, with the inode
+        # of each item to know later if it's still the same one. The
+        # inodes follow the items through the temporary names
+        batch = RenameBatch()
+        inodes = {}
+        for (old_path, new_path), result in zip(schedule, results):
+            # Handle output
             if result is None:
-                bpn_gui.last_rename.pair_append(old_path, new_path)
-            else:
-                basewidgets.ErrorFrame(error_desc=result)
+                inode = inodes.pop(old_path, None)
+                if inode is None:
+                    inode = bpn_gui.fn_treeview.entry_info_get(old_path).inode
+                # Moved to another folder, maybe in another file system
+                # where it was copied and so has another inode
+                if os.path.dirname(old_path) != os.path.dirname(new_path):
+                    inode = rename_gui_inode_get(new_path)
+                inodes[new_path] = inode
+                batch.append(old_path, new_path, inode)
+        bpn_gui.rename_history.push(batch)
         logging.info("-" * 20)
 
         trees.refresh_treeviews()
 
+        # All the errors are shown together once the batch is over
+        report = RenameErrorReport(results)
+        if report:
+            # A transactional rename has a single result: everything was
+            # renamed or nothing was
+            if transactional:
+                rename_gui_transaction_failed_show(report, results)
+                return
+            RenameErrorReportWindow(
+                report, f"{len(report)} of {len(results)} renames failed"
+            )
+
         # Show that its finish
         infobar.finish_show_working(inf_msg="Finished Rename")
 
@@ -200,6 +286,213 @@ def rename_gui_apply_rename_action(command_rename=None):
         bpn_gui.info_bar.last_action_set("No Selected Items")
 
 
+def rename_gui_inode_get(path):
+    """Returns the inode of the item at the path, None if it can't"""
+    try:
+        return os.lstat(path).st_ino
+    except OSError:
+        return None
+
+
+def rename_gui_transaction_failed_show(report, results):
+    """
+    Shows why a transactional rename failed, and the renames that
+    couldn't be rolled back (those were saved to the history)
+    """
+    error = next(
+        error
+        for error in report.errors
+        if error.reason not in (RENAME_ROLLED_BACK, RENAME_NOT_DONE)
+    )
+    not_rolled_back = results.count(None)
+
+    msg = f"Rename failed, nothing was renamed:\n{error.msg}"
+    if not_rolled_back:
+        msg = (
+            f"Rename failed and {not_rolled_back} renames couldn't be "
+            f"rolled back:\n{error.msg}"
+        )
+    RenameErrorReportWindow(report, msg)
+    infobar.finish_show_working(inf_msg="Rename Failed")
+
+
+def rename_gui_conflicts_show(conflicts):
+    """
+    Highlights the items with rename conflicts and shows an error with
+    all of them
+    """
+    # Max number of conflicts listed in the error message
+    max_listed = 10
+
+    bpn_gui.fn_treeview.conflicts_show(
+        {conflict.old_path for conflict in conflicts}
+    )
+
+    conflicts_desc = "\n".join(
+        f'"{os.path.basename(conflict.old_path)}" -> '
+        f'"{os.path.basename(conflict.new_path)}": {conflict.kind}'
+        for conflict in conflicts[:max_listed]
+    )
+    if len(conflicts) > max_listed:
+        conflicts_desc += f"\n... and {len(conflicts) - max_listed} more"
+
+    msg = f"{len(conflicts)} rename conflicts, nothing was renamed"
+    logging.error(f"{msg}:\n{conflicts_desc}")
+    basewidgets.ErrorFrame(error_desc=f"{msg}:\n{conflicts_desc}")
+    infobar.finish_show_working(inf_msg="Rename Conflicts")
+
+
+def rename_gui_journal_get():
+    """
+    The journal for a rename batch, None when there is no configuration
+    folder to save it in
+    """
+    if bpn_config.rename_journal_file is None:
+        return None
+
+    return RenameJournal(bpn_config.rename_journal_file)
+
+
+def rename_gui_journal_recover_check():
+    """
+    Checks if the last rename batch was interrupted (the program was
+    closed or crashed in the middle) and asks what to do with it
+    """
+    if bpn_config.rename_journal_file is None:
+        return
+
+    batch = journal_batch_get(bpn_config.rename_journal_file)
+    if batch is None:
+        return
+    # Interrupted before starting to rename
+    if not batch.schedule:
+        journal_remove(bpn_config.rename_journal_file)
+        return
+
+    JournalRecoverWindow(batch)
+
+
+class JournalRecoverWindow(basewidgets.PopUpWindow):
+    """
+    Pop up window to finish or roll back an interrupted rename batch, or
+    to leave it as it is
+    """
+
+    def __init__(self, batch):
+        super().__init__(title="Interrupted Rename")
+
+        ttk.Label(
+            self,
+            text=(
+                "The last rename was interrupted after "
+                f"{len(batch.done)} of {len(batch.schedule)} renames.\n"
+                "Finish it or roll it back?"
+            ),
+        ).grid(column=0, row=0, columnspan=3, padx=5, pady=5)
+
+        ttk.Button(
+            self, text="Finish", command=lambda: self.recover(False)
+        ).grid(column=0, row=1, padx=5, pady=5)
+        ttk.Button(
+            self, text="Roll Back", command=lambda: self.recover(True)
+        ).grid(column=1, row=1, padx=5, pady=5)
+        ttk.Button(self, text="Leave It", command=self.leave).grid(
+            column=2, row=1, padx=5, pady=5
+        )
+
+    def recover(self, roll_back):
+        """Finishes or rolls back the batch"""
+        self.destroy()
+        infobar.show_working()
+
+        logging.info("Recover:")
+        errors = journal_recover(
+            bpn_config.rename_journal_file,
+            rename_system_rename,
+            roll_back=roll_back,
+        )
+        logging.info("-" * 20)
+
+        trees.refresh_treeviews()
+        if errors:
+            basewidgets.ErrorFrame(
+                error_desc=f"{len(errors)} renames couldn't be recovered"
+            )
+        infobar.finish_show_working(inf_msg="Finished Recovering Rename")
+
+    def leave(self):
+        """Leaves the files as they are and forgets the batch"""
+        self.destroy()
+        journal_remove(bpn_config.rename_journal_file)
+
+
+class RenameErrorReportWindow(basewidgets.PopUpWindow):
+    """
+    Pop up window with all the errors of a rename batch: the number of
+    errors by reason and a scrollable list with the path, target, errno
+    and reason of each one, that can be exported to a file
+    """
+
+    def __init__(self, report, msg):
+        super().__init__(title="ERROR")
+        self.report = report
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        ttk.Label(self, text=f"ERROR: {msg}\n\n{report.summary_get()}").grid(
+            column=0, row=0, columnspan=3, padx=5, pady=5, sticky="w"
+        )
+
+        # List of errors
+        errors_tree = ttk.Treeview(
+            self, columns=report.columns, show="headings", height=15
+        )
+        for column in report.columns:
+            errors_tree.heading(column, text=column, anchor="w")
+        errors_tree.column("Errno", width=60, stretch=False)
+        ysb_errors_tree = ttk.Scrollbar(
+            self, orient="vertical", command=errors_tree.yview
+        )
+        xsb_errors_tree = ttk.Scrollbar(
+            self, orient="horizontal", command=errors_tree.xview
+        )
+        errors_tree.configure(
+            yscroll=ysb_errors_tree.set, xscroll=xsb_errors_tree.set
+        )
+        for row in report.rows_get():
+            errors_tree.insert("", "end", values=row)
+
+        errors_tree.grid(column=0, row=1, columnspan=2, sticky="nsew")
+        ysb_errors_tree.grid(column=2, row=1, sticky="ns")
+        xsb_errors_tree.grid(column=0, row=2, columnspan=2, sticky="ew")
+
+        ttk.Button(self, text="Export", command=self.export).grid(
+            column=0, row=3, padx=5, pady=5, sticky="e"
+        )
+        # Okay button destroys the window
+        ttk.Button(self, text="Okay", command=self.destroy).grid(
+            column=1, row=3, padx=5, pady=5
+        )
+
+    def export(self):
+        """Asks where to save the report and exports it there"""
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="Export Error Report",
+            defaultextension=".tsv",
+            filetypes=(("Tab separated values", "*.tsv"), ("All", "*")),
+        )
+        # Cancelled
+        if not path:
+            return
+
+        error = self.report.export(path)
+        if error is not None:
+            basewidgets.ErrorFrame(error_desc=error)
+        else:
+            bpn_gui.info_bar.last_action_set("Exported Error Report")
+
+
 def rename_gui_reverse_selection(selection=[]):
     # When to reverse the naming items list so as to skip naming problems
     # like with recursiveness naming a folder before the files in it so
@@ -6,7 +6,18 @@ from tkinter import ttk
 from scandirrecursive.scandirrecursive import scandir_recursive_sorted
 
 import batchpynamer.gui as bpn_gui
-from batchpynamer.data.rename_data_tools import rename_generate_new_name
+from batchpynamer.data.conflict_data_tools import (
+    collision_name_get,
+    rename_collisions_resolve,
+    rename_conflicts_get,
+)
+from batchpynamer.data.entry_data_tools import entry_info_get, path_info_get
+from batchpynamer.data.rename_data_tools import (
+    RenamePlan,
+    RenamePreview,
+    rename_new_path_get,
+)
+from batchpynamer.data.reg_exp_data_tools import RegExpTimeoutError
 from batchpynamer.gui.basewidgets import BaseWidget
 from batchpynamer.gui.notebook import notebook
 from batchpynamer.gui.notebook.rename import rename
@@ -18,7 +29,20 @@ class FileNavigator(BaseWidget, ttk.Frame):
     """
 
     def __init__(self):
-        pass
+        # Remembers the new names after each rename stage, so only the
+        # stages from the changed field onwards are recomputed
+        self.rename_preview = RenamePreview()
+        # {path: new name} currently shown in the new name column
+        self.shown_new_names = {}
+        # {path: EntryInfo} of every item in the view, from the folder scan
+        self.entries_info = {}
+        # {folder: DirListing} of the folders the new names go to, to
+        # check for conflicts
+        self.dir_listings = {}
+        # Items whose new name has a conflict
+        self.conflict_paths = set()
+        # Why the new names couldn't be generated, None when they were
+        self.new_names_error = None
 
     def tk_init(self, master):
         super().__init__(master=master, column=1, row=1, sticky="we")
@@ -42,6 +66,8 @@ class FileNavigator(BaseWidget, ttk.Frame):
         # Create second column and name it
         self.tree_folder["columns"] = "#1"
         self.tree_folder.heading("#1", text="New name", anchor="w")
+        # Highlight for items whose new name has a conflict
+        self.tree_folder.tag_configure("conflict", background="#f4b6b6")
         # Treeview and the scrollbars placing
         self.tree_folder.grid(row=0, column=2, sticky="w" + "e")
         ysb_tree_folder.grid(row=0, column=3, sticky="ns")
@@ -68,6 +94,13 @@ class FileNavigator(BaseWidget, ttk.Frame):
     def new_name_set(self, path, new_name):
         return self.tree_folder.set(path, "#1", new_name)
 
+    def entry_info_get(self, path):
+        """
+        Returns the EntryInfo (type, size, modification time and inode) of
+        an item, saved when the folder was scanned
+        """
+        return path_info_get(path, self.entries_info)
+
     def selection_get(self):
         return self.tree_folder.selection()
 
@@ -108,13 +141,60 @@ class FileNavigator(BaseWidget, ttk.Frame):
 
         var=None, index=None, mode=None for the events calls
         """
-        fields_dict = rename.rename_gui_all_fields_get()
-        for idx, path in enumerate(self.selection_get()):
-            new_name, _ = rename_generate_new_name(path, idx, fields_dict)
-            # Changes the new name column
-            self.new_name_set(path, new_name)
+        # Compile the fields once for the whole selection
+        plan = RenamePlan(rename.rename_gui_all_fields_get())
+        selection = self.selection_get()
+        try:
+            new_names = self.rename_preview.new_names_get(
+                selection, plan, self.entries_info
+            )
+            self.new_names_error = None
+        # Show the old names instead of names missing the stage, so
+        # nothing can be renamed with them
+        except RegExpTimeoutError as error:
+            new_names = [os.path.basename(path) for path in selection]
+            self.new_names_error = str(error)
+            bpn_gui.info_bar.last_action_set(self.new_names_error)
+        into_folders = bpn_gui.menu_bar.rename_into_folders.get()
+        renames = [
+            (path, rename_new_path_get(path, new_name, into_folders))
+            for path, new_name in zip(selection, new_names)
+        ]
+
+        # Show the names with the counters that will be added to the ones
+        # that collide
+        if bpn_gui.menu_bar.rename_collisions_resolve.get():
+            renames = rename_collisions_resolve(
+                renames,
+                bpn_gui.menu_bar.rename_collision_suffix.get(),
+                self.dir_listings,
+            )
+            new_names = [
+                collision_name_get(new_name, new_path)
+                for new_name, (_, new_path) in zip(new_names, renames)
+            ]
+
+        for path, new_name in zip(selection, new_names):
+            # Changes the new name column, only where it changed
+            if self.shown_new_names.get(path) != new_name:
+                self.new_name_set(path, new_name)
+                self.shown_new_names[path] = new_name
+
+        # Check the new names for conflicts before renaming
+        conflicts = rename_conflicts_get(renames, self.dir_listings)
+        self.conflicts_show({conflict.old_path for conflict in conflicts})
         logging.debug("GUI- file navigator show new name")
 
+    def conflicts_show(self, conflict_paths):
+        """Highlights the items whose new name has a conflict"""
+        for path in self.conflict_paths - conflict_paths:
+            if self.tree_folder.exists(path):
+                self.tree_folder.item(path, tags=())
+        for path in conflict_paths - self.conflict_paths:
+            self.tree_folder.item(path, tags=("conflict",))
+
+        self.conflict_paths = conflict_paths
+
     def reset_new_name(self):
         """
         Renames every item to their old name, so if you change selection
@@ -124,11 +204,20 @@ class FileNavigator(BaseWidget, ttk.Frame):
         for item in all_nodes:
             old_name = self.old_name_get(item)
             self.new_name_set(item, old_name)
+        self.shown_new_names.clear()
+        self.conflicts_show(set())
 
     def delete_children(self):
         """Delete already existing nodes in the folder view"""
         for item in self.tree_folder.get_children():
             self.tree_folder.delete(item)
+        # The same paths could be different files after a refresh
+        self.rename_preview.clear()
+        self.shown_new_names.clear()
+        self.entries_info.clear()
+        self.dir_listings.clear()
+        self.conflict_paths.clear()
+        self.new_names_error = None
 
     def refresh_view_call(self, path=None):
         """Get the folder path and update the treeview"""
@@ -145,6 +234,8 @@ class FileNavigator(BaseWidget, ttk.Frame):
                 tags=tag,
                 open=False,
             )
+            # Keep what the scan already knows so it isn't stat'd again
+            self.entries_info[entry.path] = entry_info_get(entry)
 
         # Delete the children, load the new ones and sort them
         self.delete_children()
@@ -1,7 +1,8 @@
-import os
-
 import batchpynamer.gui as bpn_gui
-from batchpynamer.data.metadata_data_tools import meta_audio_get
+from batchpynamer.data.metadata_data_tools import (
+    meta_audio_get,
+    meta_tags_invalidate,
+)
 from batchpynamer.gui.infobar import finish_show_working
 from batchpynamer.gui.notebook import notebook
 from batchpynamer.plugins.plugins_base import BasePlugin
@@ -9,12 +10,13 @@ from batchpynamer.plugins.plugins_base import BasePlugin
 
 class _MetadataPluginBaseClass(BasePlugin):
     def run(self, item, **kwargs):
-        if os.path.isfile(item):
+        if self.entry_info_get(item).is_file:
             # Get the metadata and call changes
             meta_audio = meta_audio_get(item)
             meta_audio = self.meta_changes(meta_audio, item)
 
             meta_audio.save()
+            meta_tags_invalidate(item)
 
     def meta_changes(self, meta_audio):
         raise NotImplementedError
@@ -1,5 +1,4 @@
 import logging
-import os
 import time
 
 import batchpynamer.gui as bpn_gui
@@ -23,7 +22,9 @@ class SelectMTimeToday(_SelectionPluginBaseClass):
     short_desc = "Select last modified 24h"
 
     def run(self, item):
-        mod_time = os.stat(item).st_mtime
+        mod_time = self.entry_info_get(item).mtime
+        if mod_time is None:
+            return None
         yesterday = time.time() - 24 * 60 * 60
         if mod_time >= yesterday:
             return item
@@ -6,6 +6,7 @@ from scandirrecursive.scandirrecursive import scandir_recursive_sorted
 
 import batchpynamer.gui as bpn_gui
 from batchpynamer import plugins as bpn_plugins
+from batchpynamer.data.entry_data_tools import path_info_get
 from batchpynamer.gui import infobar
 from batchpynamer.gui.trees import trees
 
@@ -80,6 +81,17 @@ class BasePlugin:
         if bpn_gui.root:
             return bpn_gui.fn_treeview.selection_get()
 
+    def entry_info_get(self, item):
+        """
+        Returns the EntryInfo (type, size, modification time and inode) of
+        an item, from the file view when there is one, so plugins don't
+        need to stat the items again
+        """
+        if bpn_gui.root:
+            return bpn_gui.fn_treeview.entry_info_get(item)
+
+        return path_info_get(item)
+
     def run(self, item=None):
         """The core of the plugin
 